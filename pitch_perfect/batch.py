@@ -0,0 +1,210 @@
+"""Batch pitch analysis of directory trees of WAV files.
+
+    perfect-batch data/ -o pitches.csv --workers 8
+
+Files are fanned out across a process pool and every file is streamed
+through `asp.track_pitch`, so each worker holds one block of one file at
+a time. Rows are written as soon as a file is done, except for Parquet,
+which is written at the end. A file that can't be analysed is reported
+and skipped, and the exit status is 1.
+"""
+import argparse
+import csv
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from functools import partial
+from pathlib import Path
+
+from pitch_perfect.thinkdsp import asp
+
+COLUMNS = ['file', 'channel', 'time', 'freq', 'pitch', 'confidence']
+
+DETECTION_METHODS = {
+    'yin': asp.YIN,
+    'autocorrelation': asp.Autocorrelation,
+    'hps': asp.HPS,
+}
+
+
+def find_wav_files(paths):
+    """Sorted WAV files under the given files or directories."""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(p for p in path.rglob('*') if p.suffix.lower() == '.wav')
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def analyse_file(filename, detection_method='yin', frame_length=11025,
+                 hop_length=None, all_channels=False):
+    """Pitch track of one file as a list of rows of COLUMNS.
+
+    Runs in the worker processes, so the arguments are plain picklable
+    values.
+    """
+    track = asp.track_pitch(
+        filename,
+        detection_method=DETECTION_METHODS[detection_method],
+        frame_length=frame_length,
+        hop_length=hop_length,
+        all_channels=all_channels)
+
+    rows = []
+    for point in track:
+        if all_channels:
+            channels = enumerate(zip(point.freq, point.pitch, point.confidence))
+        else:
+            channels = [(0, (point.freq, point.pitch, point.confidence))]
+
+        for channel, (freq, pitch, confidence) in channels:
+            rows.append((str(filename), channel, float(point.time), float(freq),
+                         pitch, float(confidence)))
+    return rows
+
+
+def _analyse_or_report(filename, **options):
+    """Return filename, rows and error of `analyse_file`, so one unreadable
+    file doesn't end the whole run. The error is a message, since not 
+    every exception can be pickled back from the workers.
+    """
+    try:
+        return filename, analyse_file(filename, **options), None
+    except Exception as error:
+        return filename, [], f'{type(error).__name__}: {error}'
+
+
+class _CsvWriter:
+    def __init__(self, fp):
+        self.writer = csv.writer(fp)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        pass
+
+
+class _JsonlWriter:
+    def __init__(self, fp):
+        self.fp = fp
+
+    def write(self, rows):
+        for row in rows:
+            # JSON has no NaN, e.g. for frames without a pitch
+            values = (None if isinstance(value, float) and not math.isfinite(value)
+                      else value for value in row)
+            self.fp.write(json.dumps(dict(zip(COLUMNS, values)), allow_nan=False) + '\n')
+
+    def close(self):
+        pass
+
+
+class _ParquetWriter:
+    def __init__(self, path):
+        self.path = path
+        self.rows = []
+
+    def write(self, rows):
+        self.rows.extend(rows)
+
+    def close(self):
+        # pandas needs pyarrow or fastparquet for Parquet
+        import pandas as pd
+        pd.DataFrame(self.rows, columns=COLUMNS).to_parquet(self.path)
+
+
+def infer_format(output):
+    suffix = Path(output).suffix.lower().lstrip('.')
+    return {'jsonl': 'jsonl', 'json': 'jsonl', 'parquet': 'parquet'}.get(suffix, 'csv')
+
+
+def run(paths, output, fmt=None, workers=None, report=sys.stderr, **options):
+    """Analyse every WAV file under paths and write one result table.
+
+    Args:
+        paths (list): Files or directories
+        output (str): Output path, '-' for stdout
+        fmt (str): 'csv', 'jsonl' or 'parquet'. Default is inferred from
+                   the output extension.
+        workers (int): Number of processes. Default is the number of CPUs.
+        report: Stream for progress reports and errors
+        options: Keyword arguments of `analyse_file`
+
+    Return number of files, elapsed seconds and a list of the filename and
+    error message of every file that failed
+    """
+    files = find_wav_files(paths)
+    fmt = fmt or infer_format(output)
+    if fmt == 'parquet' and output == '-':
+        raise ValueError('Parquet output needs a file path')
+
+    fp = None
+    if fmt == 'parquet':
+        writer = _ParquetWriter(output)
+    else:
+        fp = sys.stdout if output == '-' else open(output, 'w', newline='')
+        writer = _CsvWriter(fp) if fmt == 'csv' else _JsonlWriter(fp)
+
+    failed = []
+    started = time.monotonic()
+    try:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.imap_unordered(partial(_analyse_or_report, **options), files)
+            for done, (filename, rows, error) in enumerate(results, 1):
+                if error is None:
+                    writer.write(rows)
+                else:
+                    failed.append((str(filename), error))
+                    print(f'\r{filename}: {error}', file=report)
+                elapsed = time.monotonic() - started
+                print(f'\r{done}/{len(files)} files, {done / elapsed:.1f} files/s',
+                      end='', file=report, flush=True)
+        writer.close()
+    finally:
+        if fp is not None and fp is not sys.stdout:
+            fp.close()
+
+    elapsed = time.monotonic() - started
+    print(file=report)
+    return len(files), elapsed, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Pitch tracks of directory trees of WAV files.')
+    parser.add_argument('paths', nargs='+', help='WAV files or directories')
+    parser.add_argument('-o', '--output', default='-',
+                        help='Output file, default stdout')
+    parser.add_argument('-f', '--format', choices=['csv', 'jsonl', 'parquet'],
+                        help='Output format, default from the output extension')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes')
+    parser.add_argument('-m', '--method', choices=sorted(DETECTION_METHODS),
+                        default='yin', help='Pitch detection method')
+    parser.add_argument('--frame-length', type=int, default=11025,
+                        help='Samples per analysed frame')
+    parser.add_argument('--hop-length', type=int,
+                        help='Samples between frames, default half a frame')
+    parser.add_argument('--all-channels', action='store_true',
+                        help='Track every channel instead of the first one')
+    args = parser.parse_args(argv)
+
+    count, elapsed, failed = run(
+        args.paths, args.output, fmt=args.format, workers=args.workers,
+        detection_method=args.method, frame_length=args.frame_length,
+        hop_length=args.hop_length, all_channels=args.all_channels)
+    print(f'Analysed {count} files in {elapsed:.2f}s '
+          f'({count / max(elapsed, 1e-9):.1f} files/s)', file=sys.stderr)
+    if failed:
+        print(f'{len(failed)} files failed:', file=sys.stderr)
+        for filename, error in failed:
+            print(f'  {filename}: {error}', file=sys.stderr)
+        return 1
+    return 0
@@ -0,0 +1,83 @@
+"""Tests for the batch pitch analysis of pitch_perfect.
+"""
+
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from pitch_perfect import batch
+from pitch_perfect.config import PATHS
+
+
+def reject_constant(name):
+    raise ValueError(f'{name} is not valid JSON')
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.files = [str(PATHS.data / 'piano' / 'c6.wav'),
+                      str(PATHS.data / 'piano' / 'd6.wav')]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def testCsv(self):
+        output = self.path('pitches.csv')
+        count, _, failed = batch.run(self.files, output, workers=2, report=io.StringIO())
+        self.assertEqual(count, 2)
+        self.assertEqual(failed, [])
+
+        with open(output, newline='') as fp:
+            rows = list(csv.DictReader(fp))
+        self.assertEqual(list(rows[0]), batch.COLUMNS)
+        self.assertEqual({row['file'] for row in rows}, set(self.files))
+        pitches = [row['pitch'] for row in rows if row['file'] == self.files[0]]
+        self.assertIn('c6', pitches)
+
+    def testJsonlWithoutPitch(self):
+        output = self.path('pitches.jsonl')
+        batch.run(self.files, output, workers=2, report=io.StringIO(),
+                  detection_method='hps', frame_length=2048)
+
+        with open(output) as fp:
+            rows = [json.loads(line, parse_constant=reject_constant) for line in fp]
+        self.assertEqual({row['file'] for row in rows}, set(self.files))
+        # The silence at the start of the recordings has no pitch
+        self.assertTrue(any(row['freq'] is None and row['pitch'] is None for row in rows))
+
+    def testCorruptFileIsSkipped(self):
+        corrupt = self.path('corrupt.wav')
+        with open(corrupt, 'wb') as fp:
+            fp.write(b'RIFF\0\0\0\0WAVEjunk')
+        output = self.path('pitches.csv')
+        report = io.StringIO()
+
+        count, _, failed = batch.run(self.files + [corrupt], output, workers=2, report=report)
+        self.assertEqual(count, 3)
+        self.assertEqual([filename for filename, _ in failed], [corrupt])
+        self.assertIn(corrupt, report.getvalue())
+
+        with open(output, newline='') as fp:
+            files = {row['file'] for row in csv.DictReader(fp)}
+        self.assertEqual(files, set(self.files))
+
+    def testMain(self):
+        output = self.path('pitches.jsonl')
+        status = batch.main([str(PATHS.data / 'piano'), '-o', output, '-j', '2',
+                             '-m', 'autocorrelation', '--frame-length', '4096'])
+        self.assertEqual(status, 0)
+        with open(output) as fp:
+            files = {json.loads(line)['file'] for line in fp}
+        self.assertEqual(len(files), len(batch.find_wav_files([PATHS.data / 'piano'])))
+
+
+if __name__ == '__main__':
+    unittest.main()
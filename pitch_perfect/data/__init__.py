@@ -1 +1,2 @@
-from .constants import FREQUENCY_KEY_MAP, FREQUENCY_ARRAY
\ No newline at end of file
+from .constants import FREQUENCY_KEY_MAP, FREQUENCY_ARRAY
+from .constants import SORTED_KEY_ARRAY, SORTED_FREQUENCY_ARRAY, SORTED_MIDI_ARRAY
\ No newline at end of file
@@ -106,3 +106,11 @@ KEY_FREQUENCY_MAP = {
 FREQUENCY_KEY_MAP = { v:k for k, v in KEY_FREQUENCY_MAP.items()}
 
 FREQUENCY_ARRAY = np.array(list(FREQUENCY_KEY_MAP.keys()))
+
+# Note table sorted by frequency for O(log n) lookup with np.searchsorted
+SORTED_KEY_ARRAY = np.array(sorted(KEY_FREQUENCY_MAP, key=KEY_FREQUENCY_MAP.get))
+
+SORTED_FREQUENCY_ARRAY = np.array([KEY_FREQUENCY_MAP[k] for k in SORTED_KEY_ARRAY])
+
+# MIDI note numbers of the sorted table, where 69 is 440 Hz
+SORTED_MIDI_ARRAY = np.round(69 + 12 * np.log2(SORTED_FREQUENCY_ARRAY / 440)).astype(int)
@@ -0,0 +1,275 @@
+"""asyncio engine that lets several pipelines (detector, transfer, logger, ...)
+share one captured audio stream in a single process.
+
+    engine = Engine(MicrophoneStream(system.default_mic))
+    engine.add_pipeline(detect, asp.YIN, on_pitch=print)
+    engine.add_pipeline(log_levels)
+    engine.add_pipeline(record, 'capture.wav')
+    engine.run_forever()
+"""
+import asyncio
+import curses
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from pitch_perfect.pitch_perfect import FRAMERATE, PitchUI, PitchDetectorAudioSystem, PitchTransfer
+from pitch_perfect.thinkdsp import asp, wavio
+
+logger = logging.getLogger(__name__)
+
+
+class MicrophoneStream:
+    def __init__(self, mic, samplerate=FRAMERATE, numframes=FRAMERATE//4, channels=1):
+        """Async iterator of chunks recorded from a soundcard microphone or
+        a source of pitch_perfect.sources. A source that runs out ends the
+        stream.
+
+        The recorder is opened, read and closed on one dedicated thread,
+        because soundcard devices must stay on the thread that opened them.
+
+        Args:
+            mic: soundcard microphone or audio source
+            samplerate (int): Sample rate to record at
+            numframes (int): Number of samples per chunk
+            channels (int): Number of channels. Chunks are (frames x channels)
+        """
+        self.mic = mic
+        self.samplerate = samplerate
+        self.numframes = numframes
+        self.channels = channels
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='capture') as executor:
+            recorder = self.mic.recorder(samplerate=self.samplerate, channels=self.channels)
+            mic = await loop.run_in_executor(executor, recorder.__enter__)
+            try:
+                while True:
+                    try:
+                        ys = await loop.run_in_executor(executor, mic.record, self.numframes)
+                    except EOFError:
+                        return
+                    yield ys
+            finally:
+                await loop.run_in_executor(executor, recorder.__exit__, None, None, None)
+
+
+class Subscription:
+    def __init__(self, samplerate, queue_size=4):
+        """One pipeline's view of a broadcast stream. An async iterator of
+        chunks that drops the oldest chunk when the pipeline falls behind.
+
+        Args:
+            samplerate (int): Sample rate of the chunks
+            queue_size (int): Number of chunks buffered for the pipeline
+        """
+        self.samplerate = samplerate
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        # Number of chunks dropped because the pipeline fell behind
+        self.overruns = 0
+
+    def put(self, ys):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.overruns += 1
+        self.queue.put_nowait(ys)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        ys = await self.queue.get()
+        if ys is None:
+            raise StopAsyncIteration
+        return ys
+
+
+class Engine:
+    def __init__(self, source, queue_size=4):
+        """Read one audio source and fan its chunks out to every pipeline.
+
+        Args:
+            source: Async iterable of chunks with a samplerate attribute,
+                    e.g. MicrophoneStream
+            queue_size (int): Number of chunks buffered per pipeline
+        """
+        self.source = source
+        self.queue_size = queue_size
+        self.subscriptions = []
+        self.pipelines = []
+
+    def subscribe(self):
+        subscription = Subscription(self.source.samplerate, self.queue_size)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def add_pipeline(self, pipeline, *args, **kwargs):
+        """Register a pipeline coroutine function. It is called as
+        pipeline(chunks, *args, **kwargs) where chunks is a Subscription.
+
+        Return the Subscription of the pipeline
+        """
+        chunks = self.subscribe()
+        self.pipelines.append((pipeline, chunks, args, kwargs))
+        return chunks
+
+    async def broadcast(self):
+        try:
+            async for ys in self.source:
+                for subscription in self.subscriptions:
+                    subscription.put(ys)
+        finally:
+            # Tell every pipeline that the stream has ended
+            for subscription in self.subscriptions:
+                subscription.put(None)
+
+    async def run(self):
+        await asyncio.gather(
+            self.broadcast(),
+            *(pipeline(chunks, *args, **kwargs)
+              for pipeline, chunks, args, kwargs in self.pipelines)
+        )
+
+    def run_forever(self):
+        asyncio.run(self.run())
+
+
+async def detect(chunks, detection_method, on_pitch, quiet_threshold=60):
+    """Pipeline that detects the pitch of every chunk. The detector runs in
+    the default executor so it never blocks the event loop.
+
+    Args:
+        chunks (Subscription): Audio chunks
+        detection_method (asp.PitchAnalysis): Pitch detector
+        on_pitch (callable): Called with pitch, freq and spl of every chunk.
+                             Pitch and freq are None for quiet chunks, and
+                             lists with one entry per channel for
+                             multi-channel chunks.
+    """
+    loop = asyncio.get_running_loop()
+    async for ys in chunks:
+        spl = asp.get_sound_pressure_level(ys)
+        if asp.is_quiet(spl, threshold=quiet_threshold):
+            on_pitch(None, None, spl)
+            continue
+
+        if ys.ndim == 2 and ys.shape[1] > 1:
+            # Every channel of the (frames x channels) chunk in one pass
+            pitches, freqs, _ = await loop.run_in_executor(
+                None, detection_method.get_pitch_freqs, ys.T, chunks.samplerate)
+            on_pitch(list(pitches), list(freqs), spl)
+            continue
+
+        pitch, freq = await loop.run_in_executor(
+            None, detection_method.get_pitch_freq, ys, chunks.samplerate)
+        on_pitch(pitch, freq, spl)
+
+
+async def transfer(chunks, pitch_transfer, speaker, ui):
+    """Pipeline that drives PitchTransfer's state machine. Each step may
+    play audio, so it runs in a single-thread executor that also owns the
+    speaker. Chunks dropped during the playback count towards the flush.
+
+    Args:
+        chunks (Subscription): Audio chunks
+        pitch_transfer (PitchTransfer): Transfer state machine
+        speaker: soundcard speaker
+        ui (PitchUI): Canvas
+    """
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='transfer') as executor:
+        player = speaker.player(samplerate=chunks.samplerate)
+        player = await loop.run_in_executor(executor, player.__enter__)
+        try:
+            pitch_transfer.reset()
+            overruns = chunks.overruns
+            async for ys in chunks:
+                if chunks.overruns != overruns:
+                    # The chunks dropped while a step was playing were
+                    # recorded all the same, so they count as flushed
+                    pitch_transfer.drop_frames((chunks.overruns - overruns) * len(ys))
+                    overruns = chunks.overruns
+                await loop.run_in_executor(executor, pitch_transfer.step, ys, player, ui)
+        finally:
+            await loop.run_in_executor(executor, player.__exit__, None, None, None)
+
+
+async def log_levels(chunks, windows=(0.25, 1.0), level=logging.INFO):
+    """Pipeline that logs the sound pressure level of every chunk.
+
+    Args:
+        chunks (Subscription): Audio chunks
+        windows (tuple): Window lengths in seconds, see asp.SPLMeter
+    """
+    meter = asp.SPLMeter(chunks.samplerate, windows=windows)
+    async for ys in chunks:
+        levels = meter.update(ys)
+        logger.log(level, 'SPL %s dB, %d overruns',
+                   ', '.join(f'{spl:.1f}' for spl in levels), chunks.overruns)
+
+
+async def record(chunks, filename, sample_format='int16', append=False):
+    """Pipeline that writes the stream to a WAV file. Writes run in a 
+    single-thread executor so disk latency never blocks the event loop.
+
+    Args:
+        chunks (Subscription): Audio chunks
+        filename (str or Path): WAV file
+        sample_format (str): See wavio.WavWriter
+        append (bool): Continue an existing recording
+    """
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='record') as executor:
+        writer = None
+        try:
+            async for ys in chunks:
+                if writer is None:
+                    nchannels = 1 if ys.ndim == 1 else ys.shape[1]
+                    writer = wavio.WavWriter(filename, chunks.samplerate, nchannels=nchannels,
+                                           sample_format=sample_format, append=append)
+                await loop.run_in_executor(executor, writer.write, ys)
+        finally:
+            if writer is not None:
+                await loop.run_in_executor(executor, writer.close)
+
+
+def run_detector(detection_method=asp.YIN, source=None, channels=1):
+    """Run the pitch detector app on the engine.
+
+    Args:
+        source: Audio source, see PitchDetectorAudioSystem
+        channels (int): Number of channels to detect the pitch of
+    """
+    ui = curses.wrapper(PitchUI, "Pitch Detector")
+    ui.update_canvas()
+
+    def show(pitch, freq, spl):
+        if pitch is None:
+            ui.update_canvas()
+        elif isinstance(pitch, list):
+            ui.update_canvas(' | '.join(f'{p}: {f:.2f}HZ' for p, f in zip(pitch, freq)))
+        else:
+            ui.update_canvas(f'{pitch}: {freq:.2f}HZ')
+
+    system = PitchDetectorAudioSystem(source)
+    engine = Engine(MicrophoneStream(system.default_mic, channels=channels))
+    engine.add_pipeline(detect, detection_method, show)
+    engine.run_forever()
+
+
+def run_transfer(detection_method=asp.YIN, source=None, speaker=None):
+    """Run the pitch transfer app on the engine.
+
+    Args:
+        source, speaker: Audio devices, see PitchDetectorAudioSystem
+    """
+    ui = curses.wrapper(PitchUI, "Pitch Transfer")
+    ui.update_canvas()
+
+    pitch_transfer = PitchTransfer(detection_method, source=source, speaker=speaker)
+    engine = Engine(MicrophoneStream(
+        pitch_transfer.default_mic,
+        samplerate=pitch_transfer.samplerate,
+        numframes=pitch_transfer.numframes))
+    engine.add_pipeline(transfer, pitch_transfer, pitch_transfer.default_speaker, ui)
+    engine.run_forever()
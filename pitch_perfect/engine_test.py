@@ -0,0 +1,142 @@
+"""Tests for the asyncio engine of pitch_perfect.
+"""
+
+import asyncio
+import threading
+import unittest
+
+import numpy as np
+
+from pitch_perfect import engine
+from pitch_perfect.pitch_perfect import PitchTransfer
+from pitch_perfect.sources import SignalSource
+from pitch_perfect.thinkdsp import asp, thinkdsp
+
+
+class ToneBursts:
+    def __init__(self, *bursts, freq=440, amp=0.5):
+        """Signal that is a tone during the (start, end) bursts in seconds
+        and digital silence otherwise.
+        """
+        self.bursts = bursts
+        self.freq = freq
+        self.amp = amp
+
+    def evaluate(self, ts):
+        on = np.any([(start <= ts) & (ts < end) for start, end in self.bursts], axis=0)
+        return np.where(on, self.amp * np.sin(2 * np.pi * self.freq * ts), 0)
+
+
+class BlockingSpeaker:
+    """Speaker whose play blocks until as many frames as it plays have been
+    recorded, like a device that plays in real time.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.recorded = 0
+        # Frames of the current playback not recorded over yet
+        self.unplayed = 0
+        # (recorded frames, played frames) of every playback
+        self.plays = []
+
+    def player(self, samplerate, channels=None):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def record(self, numframes):
+        with self.condition:
+            self.recorded += numframes
+            self.unplayed = max(self.unplayed - numframes, 0)
+            self.condition.notify_all()
+
+    def play(self, ys):
+        with self.condition:
+            self.plays.append((self.recorded, len(ys)))
+            self.unplayed = len(ys)
+            self.condition.wait_for(lambda: self.unplayed == 0)
+
+
+class PacedStream:
+    def __init__(self, source, samplerate, numframes, speaker):
+        """Chunks of an audio source that wait for the pipeline to take the
+        previous chunk, except during a playback. Then they keep coming 
+        like from a real microphone and overrun the subscription.
+        """
+        self.source = source
+        self.samplerate = samplerate
+        self.numframes = numframes
+        self.speaker = speaker
+        self.chunks = None
+
+    async def __aiter__(self):
+        with self.source.recorder(self.samplerate) as mic:
+            while True:
+                while not self.speaker.unplayed and not self.chunks.queue.empty():
+                    await asyncio.sleep(0.001)
+                try:
+                    ys = mic.record(self.numframes)
+                except EOFError:
+                    return
+                yield ys
+                self.speaker.record(len(ys))
+
+
+class RecordingUI:
+    def __init__(self, speaker):
+        self.speaker = speaker
+        # (message, recorded frames) of every update
+        self.updates = []
+
+    def update_canvas(self, pitch='-----'):
+        self.updates.append((pitch, self.speaker.recorded))
+
+
+class Test(unittest.TestCase):
+
+    def testTransferCountsDroppedChunks(self):
+        samplerate, numframes, echo_duration = 8000, 500, 0.5
+        speaker = BlockingSpeaker()
+        source = SignalSource(ToneBursts((0, 0.5)), duration=4)
+        pitch_transfer = PitchTransfer(
+            asp.YIN, samplerate=samplerate, numframes=numframes,
+            echo_duration=echo_duration, source=source, speaker=speaker)
+        # Transfer as soon as the input is quiet instead of after a second
+        # of wall-clock time
+        pitch_transfer.should_wait_for_input = lambda timestamp: False
+        ui = RecordingUI(speaker)
+
+        stream = PacedStream(source, samplerate, numframes, speaker)
+        loop = engine.Engine(stream, queue_size=4)
+        stream.chunks = loop.add_pipeline(engine.transfer, pitch_transfer, speaker, ui)
+        loop.run_forever()
+
+        self.assertEqual(len(speaker.plays), 1)
+        self.assertGreater(stream.chunks.overruns, 0)
+
+        # The flush ends after the playback and its echo, although most of
+        # the chunks recorded during the playback were dropped
+        start, played = speaker.plays[0]
+        messages = [message for message, _ in ui.updates]
+        _, end = ui.updates[messages.index('Transferring') + 1]
+        expected = played + echo_duration * samplerate
+        self.assertLessEqual(abs(end - start - expected), 2 * numframes)
+
+    def testDetectEveryChannel(self):
+        source = SignalSource(thinkdsp.SinSignal(440, amp=0.5), duration=1)
+        stream = engine.MicrophoneStream(source, samplerate=8000, numframes=2000, channels=2)
+        results = []
+        loop = engine.Engine(stream)
+        loop.add_pipeline(engine.detect, asp.YIN,
+                          lambda pitch, freq, spl: results.append(pitch))
+        loop.run_forever()
+
+        self.assertEqual(results, [['a3', 'a3']] * 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,23 @@
-import soundcard as sc
 import numpy as np
 import matplotlib.pyplot as plt
 
 import sys,os
 import curses
+import queue
+import threading
+import warnings
+from collections import deque
+
+try:
+    import soundcard as sc
+except Exception:
+    # soundcard fails to import on machines without an audio server
+    sc = None
+    warnings.warn("Can't import soundcard; pass an audio source from "
+                  "pitch_perfect.sources to the apps.")
 
 from pitch_perfect.data import FREQUENCY_KEY_MAP, FREQUENCY_ARRAY
+from pitch_perfect.sources import NullSpeaker, SoundcardSource
 from pitch_perfect.thinkdsp import asp, thinkdsp
 import time 
 
@@ -85,61 +97,245 @@ which tend to have low energy.
 1E-06 ignores E4 guitar string
 '''
 AMBIENCE_THRESHOLD = 1E-07
-class PitchDetectorAudioSystem():
 
-    def __init__(self):
+# Passed through the queues of PitchDetector when the source has run out
+END_OF_STREAM = object()
+
+class PitchDetectorAudioSystem():
 
-        # get a list of all speakers:
-        speakers = sc.all_speakers()
-        # get the current default speaker on your system:
-        self.default_speaker = sc.default_speaker()
-        # get a list of all microphones:
-        mics = sc.all_microphones()
-        # get the current default microphone on your system:
-        self.default_mic = self.__get_build_in_mic(mics)
+    def __init__(self, source=None, speaker=None):
+        """
+        Args:
+            source: Audio source with a soundcard-like recorder(), see
+                    pitch_perfect.sources. Default is the default microphone
+                    of the system.
+            speaker: Output with a soundcard-like player(). Default is the
+                     default speaker of the system, or a NullSpeaker when
+                     soundcard is not available.
+        """
+        if source is None and sc is None:
+            raise BuiltInMicrophoneNotFoundError('soundcard is not available')
 
+        if speaker is None:
+            # get the current default speaker on your system:
+            speaker = NullSpeaker() if sc is None else sc.default_speaker()
+        self.default_speaker = speaker
 
-    def __get_build_in_mic(self, mics):
-        for m in mics:
-            if m.name == 'Built-in Microphone':
-                return m
-        else:
-            raise BuiltInMicrophoneNotFoundError
+        if source is None:
+            # get the current default microphone on your system:
+            source = SoundcardSource()
+        self.default_mic = source
 
 
 class PitchDetector(PitchDetectorAudioSystem):
-    def __init__(self, detection_method):
-        super(PitchDetector, self).__init__()
+    def __init__(self, detection_method, target_samplerate=None, source=None, channels=1):
+        """
+        Args:
+            detection_method (asp.PitchAnalysis): Pitch detector
+            target_samplerate (int): If given, chunks are decimated to this
+                                     sample rate before pitch detection.
+            source: Audio source, see PitchDetectorAudioSystem
+            channels (int): Number of channels to record. Every channel is
+                            tracked in the same vectorized pass.
+        """
+        super(PitchDetector, self).__init__(source)
         self.detection_method = detection_method
+        self.channels = channels
+        self.decimator = None if target_samplerate is None else \
+                         asp.Decimator(FRAMERATE, target_samplerate)
         
 
-    def listen(self, ui):
-        with self.default_mic.recorder(samplerate=FRAMERATE, channels=1) as mic:
-            while True:
-                ys = mic.record(numframes=FRAMERATE//4)
-                spl = asp.get_sound_pressure_level(ys)
+    def listen(self, ui, queue_size=4):
+        """Capture, analyse and render in separate threads joined by bounded
+        queues. A slow detector or UI drops the oldest chunks instead of
+        delaying `mic.record`. Dropped chunks are counted in 
+        `self.chunks.overruns` and `self.results.overruns`.
 
-                if asp.is_quiet(spl, threshold=60):
-                    # self.update_canvas(f'Too quiet. mean:{ys.mean()}, max: {ys.max()}')
-                    ui.update_canvas()
-                    continue
-                
-                # pitch, freq = asp.Autocorrelation.get_pitch_freq(ys, samplerate=FRAMERATE)
-                pitch, freq = self.detection_method.get_pitch_freq(ys, samplerate=FRAMERATE)
+        An exception in the capture or analysis thread stops all threads
+        and is raised again from here.
+
+        Args:
+            ui (PitchUI): Canvas, rendered from the calling thread
+            queue_size (int): Capacity of each queue
+        """
+        self.chunks = DropOldestQueue(queue_size)
+        self.results = DropOldestQueue(queue_size)
+        self.stop_event = threading.Event()
+        self.error = None
+
+        workers = (
+            threading.Thread(target=self.run_worker, args=(self.capture,),
+                             name='capture', daemon=True),
+            threading.Thread(target=self.run_worker, args=(self.analyse,),
+                             name='analysis', daemon=True),
+        )
+        for worker in workers:
+            worker.start()
+
+        try:
+            self.render(ui)
+        finally:
+            self.stop_event.set()
+            for worker in workers:
+                worker.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def run_worker(self, target):
+        try:
+            target()
+        except Exception as error:
+            # Keep the first error and stop the other threads, so `listen`
+            # can raise it instead of waiting forever for results
+            if self.error is None:
+                self.error = error
+            self.stop_event.set()
+
+    def capture(self, numframes=FRAMERATE//4):
+        with self.default_mic.recorder(samplerate=FRAMERATE, channels=self.channels) as mic:
+            while not self.stop_event.is_set():
+                try:
+                    ys = mic.record(numframes=numframes)
+                except EOFError:
+                    # A file or synthetic source has run out
+                    break
+                self.chunks.put(ys)
+
+        # Let the analysis drain the queue before stopping
+        self.chunks.put(END_OF_STREAM)
+
+    def analyse(self):
+        samplerate = FRAMERATE if self.decimator is None else self.decimator.samplerate
+        # Reused by the detector on every chunk instead of a fresh allocation
+        cmn_buffer = None
+        overruns = 0
+
+        while not self.stop_event.is_set():
+            try:
+                ys = self.chunks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if ys is END_OF_STREAM:
+                self.results.put(END_OF_STREAM)
+                return
+
+            spl = asp.get_sound_pressure_level(ys)
+
+            if self.decimator is not None:
+                if self.chunks.overruns != overruns:
+                    # Chunks were dropped, so the filter history is stale
+                    overruns = self.chunks.overruns
+                    self.decimator.reset()
+                # Decimate every chunk, including the quiet ones, so the 
+                # filter history stays continuous
+                ys = self.decimator.decimate(ys)
+
+            if asp.is_quiet(spl, threshold=60):
+                self.results.put(None)
+                continue
+
+            if self.channels > 1:
+                self.results.put(self.analyse_channels(ys, samplerate))
+                continue
+
+            # The decimated chunk length may differ by a sample between chunks
+            lag_count = self.detection_method.lag_count(len(ys))
+            if cmn_buffer is None or len(cmn_buffer) != lag_count:
+                cmn_buffer = np.empty(lag_count)
+            
+            # pitch, freq = asp.Autocorrelation.get_pitch_freq(ys, samplerate=FRAMERATE)
+            pitch, freq = self.detection_method.get_pitch_freq(
+                ys, samplerate=samplerate, out=cmn_buffer)
+            
+            # self.__is_high_pitch = True if int(pitch[-1]) > 4 else False
                 
-                # self.__is_high_pitch = True if int(pitch[-1]) > 4 else False
-                    
-                sentence = f'{pitch}: {freq:.2f}HZ'
+            self.results.put(f'{pitch}: {freq:.2f}HZ')
+
+    def analyse_channels(self, ys, samplerate):
+        """Detect the pitch of every channel of a (frames x channels) chunk
+        in one vectorized pass.
+        """
+        pitches, freqs, _ = self.detection_method.get_pitch_freqs(
+            np.asarray(ys).T, samplerate=samplerate)
+        return ' | '.join(f'{pitch}: {freq:.2f}HZ' for pitch, freq in zip(pitches, freqs))
+
+    def render(self, ui):
+        while not self.stop_event.is_set():
+            try:
+                sentence = self.results.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if sentence is END_OF_STREAM:
+                return
+
+            if sentence is None:
+                # self.update_canvas(f'Too quiet. mean:{ys.mean()}, max: {ys.max()}')
+                ui.update_canvas()
+            else:
                 ui.update_canvas(sentence)
 
+
+class DropOldestQueue:
+    def __init__(self, maxsize):
+        """Thread-safe bounded FIFO. Putting into a full queue drops the 
+        oldest item instead of blocking the producer.
+
+        Args:
+            maxsize (int): Capacity
+        """
+        self.items = deque(maxlen=maxsize)
+        self.condition = threading.Condition()
+        # Number of items dropped because the queue was full
+        self.overruns = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item):
+        with self.condition:
+            if len(self.items) == self.items.maxlen:
+                self.overruns += 1
+            self.items.append(item)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Remove and return the oldest item. 
+
+        Raises queue.Empty if no item arrives within timeout seconds.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.items, timeout):
+                raise queue.Empty
+            return self.items.popleft()
+
                 
+# States of PitchTransfer. The transfer itself plays within one step, so
+# it goes straight from LISTENING to FLUSHING.
+LISTENING = 'listening'
+FLUSHING = 'flushing'
+
+
 class PitchTransfer(PitchDetectorAudioSystem):
 
-    def __init__(self, detection_method, samplerate=FRAMERATE, numframes=FRAMERATE//16):
-        super(PitchTransfer, self).__init__()
+    def __init__(self, detection_method, samplerate=FRAMERATE, numframes=FRAMERATE//16,
+                 ambience_threshold=70, echo_duration=1, source=None, speaker=None):
+        """
+        Args:
+            detection_method (asp.PitchAnalysis): Pitch detector
+            ambience_threshold (float): Sound pressure level of ambient noise
+            echo_duration (float): Seconds of input dropped after a transfer
+                                   so the system doesn't listen to its echo
+            source, speaker: Audio devices, see PitchDetectorAudioSystem
+        """
+        super(PitchTransfer, self).__init__(source, speaker)
         self.detection_method = detection_method
         self.samplerate = samplerate
         self.numframes = numframes
+        self.ambience_threshold = ambience_threshold
+        self.echo_duration = echo_duration
+        self.segment_for_spl = asp.RingBuffer(self.samplerate//2)
+        self.reset()
 
     def should_wait_for_input(self, last_input_timestamp):
         timedelta = time.time() - last_input_timestamp
@@ -165,63 +361,97 @@ class PitchTransfer(PitchDetectorAudioSystem):
         wave = self.synthesize(frequencies)
         speaker.play(wave)
 
-    def get_loudness_of_segment(self, old, new):
-        """
+    def get_loudness_of_segment(self, window, new):
+        """Slide the window over the new chunk and return its loudness.
+
+        Args:
+            window (asp.RingBuffer): Latest samples
+            new (np.array): Recorded chunk
         """
-        new_length = len(new)
-        old = old[new_length:]
-        segment = np.concatenate([old, new])
-        return asp.get_sound_pressure_level(segment)
+        window.extend(new)
+        return window.get_sound_pressure_level()
 
     def _is_ready_to_transfer(self, spl, ambience_threshold, last_input_timestamp, frequencies):
         return asp.is_quiet(spl, threshold=ambience_threshold) and \
                 not self.should_wait_for_input(last_input_timestamp) and \
                 len(frequencies) > 0
 
+    def reset(self):
+        """Start a new listening session."""
+        self.state = LISTENING
+        self.last_input_timestamp = 0
+        self.frequencies = []
+        self.frames_to_flush = 0
+        self.segment_for_spl.reset()
+
+    def drop_frames(self, numframes):
+        """Count recorded frames that never reach `step` towards the flush,
+        e.g. chunks a full queue dropped while the transfer was playing.
+        """
+        if self.state != FLUSHING:
+            return
+        self.frames_to_flush -= numframes
+        if self.frames_to_flush <= 0:
+            self.reset()
+
+    def step(self, ys, speaker, ui):
+        """Advance the listen/transfer/flush state machine by one recorded 
+        chunk.
+
+        Args:
+            ys (np.array): Recorded chunk
+            speaker: Open player for the transfer
+            ui (PitchUI): Canvas to report the state on
+        """
+        if self.state == FLUSHING:
+            # Drop the chunks recorded during the playback and its echo
+            self.drop_frames(len(ys))
+            return
 
+        # Get loudness of half sec
+        spl = self.get_loudness_of_segment(self.segment_for_spl, ys)
+        
+        if self._is_ready_to_transfer(spl, self.ambience_threshold, 
+                                      self.last_input_timestamp, self.frequencies):
+            ui.update_canvas(f'Transferring')
+            self.play_pitch_transfer(self.frequencies, speaker)
+
+            # NOTE: The recorder keeps capturing during the playback, and 
+            # Recorder.flush() does not flush all the chunks piled up. Count
+            # the piled frames, plus a second of "echo" of the transfer, and
+            # drop them as they are read.
+            self.frames_to_flush = len(self.frequencies) * self.numframes + \
+                                   int(self.echo_duration * self.samplerate)
+            self.state = FLUSHING
+            return
+            
+        if asp.is_quiet(spl, threshold=self.ambience_threshold) and \
+            not self.should_wait_for_input(self.last_input_timestamp):
+            ui.update_canvas(f'Quiet {spl:.2f} dB')
+            return
+
+        if not asp.is_quiet(spl, threshold=self.ambience_threshold):
+            self.last_input_timestamp = time.time()
+
+        # pitch, freq = asp.Autocorrelation.get_pitch_freq(ys, samplerate=FRAMERATE)
+        pitch, freq = self.detection_method.get_pitch_freq(
+            ys, samplerate=self.samplerate)
+        self.frequencies.append(freq)                
+        ui.update_canvas(f'Listening! {spl:.2f} dB,  Pitch: {pitch}')
 
     def listen(self, ui):
-        last_input_timestamp = 0
-        frequencies = []
-        ambience_threshold = 70
-        segment_for_spl = np.zeros(self.samplerate//2)
-
+        # Both devices stay open for the whole session. Stale audio is 
+        # dropped by the FLUSHING state rather than by reopening them.
         with self.default_mic.recorder(samplerate=self.samplerate, channels=1) as mic, \
              self.default_speaker.player(samplerate=self.samplerate) as speaker:
+            self.reset()
             while True:
-                ys = mic.record(numframes=self.numframes)
-
-                # Get loudness of half sec
-                spl = self.get_loudness_of_segment(segment_for_spl, ys)
-                
-                if self._is_ready_to_transfer(spl, ambience_threshold, last_input_timestamp, frequencies):
-                    ui.update_canvas(f'Transferring')
-                    self.play_pitch_transfer(frequencies, speaker)
-
-                    # You need to sleep 1 second so the system doesn't wrongly 
-                    # listen to "echo" of the transfer
-                    time.sleep(1)
-
-                    # NOTE: Soundcard module works only with context manager, and
-                    # the Recorder.flush() does not flush all the chunks piled
-                    # during the playback.
-                    # Thus, recursion is needed in order to flush recorded chunk
-                    return self.listen(ui)
-                    
-                
-                if asp.is_quiet(spl, threshold=ambience_threshold) and \
-                    not self.should_wait_for_input(last_input_timestamp):
-                    ui.update_canvas(f'Quiet {spl:.2f} dB')
-                    continue
-
-                if not asp.is_quiet(spl, threshold=ambience_threshold):
-                    last_input_timestamp = time.time()
-
-
-                # pitch, freq = asp.Autocorrelation.get_pitch_freq(ys, samplerate=FRAMERATE)
-                pitch, freq = asp.YIN.get_pitch_freq(ys, samplerate=FRAMERATE)
-                frequencies.append(freq)                
-                ui.update_canvas(f'Listening! {spl:.2f} dB,  Pitch: {pitch}')
+                try:
+                    ys = mic.record(numframes=self.numframes)
+                except EOFError:
+                    # A file or synthetic source has run out
+                    return
+                self.step(ys, speaker, ui)
 
 
 def make_spectrum(ys, full=False, framerate=FRAMERATE):
@@ -244,11 +474,11 @@ def make_spectrum(ys, full=False, framerate=FRAMERATE):
 
 class PitchDetectorApp:
 
-    def __init__(self, detection_method):
+    def __init__(self, detection_method, target_samplerate=None, channels=1):
         self.ui = curses.wrapper(PitchUI, "Pitch Detector")
         self.ui.update_canvas()
 
-        self.detector = PitchDetector(detection_method)
+        self.detector = PitchDetector(detection_method, target_samplerate, channels=channels)
         self.detector.listen(self.ui)
     
 class PitchTransferApp:
@@ -265,5 +495,5 @@ class BuiltInMicrophoneNotFoundError(Exception):
     pass
 
 
-def main(detection_method=asp.YIN):
-    PitchDetectorApp(detection_method)
+def main(detection_method=asp.YIN, target_samplerate=None, channels=1):
+    PitchDetectorApp(detection_method, target_samplerate, channels)
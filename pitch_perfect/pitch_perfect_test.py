@@ -0,0 +1,228 @@
+"""Tests for the apps of pitch_perfect.
+"""
+
+import queue
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from pitch_perfect import pitch_perfect
+from pitch_perfect.config import PATHS
+from pitch_perfect.pitch_perfect import (
+    FLUSHING, LISTENING, DropOldestQueue, PitchDetector, PitchTransfer)
+from pitch_perfect.sources import NullSpeaker, SignalSource, SoundcardSource, WavFileSource
+from pitch_perfect.thinkdsp import asp, thinkdsp
+
+
+class RecordingUI:
+    def __init__(self, delay=0):
+        """Canvas that keeps every update instead of drawing it.
+
+        Args:
+            delay (float): Seconds every update takes
+        """
+        self.delay = delay
+        self.updates = []
+
+    def update_canvas(self, pitch='-----'):
+        time.sleep(self.delay)
+        self.updates.append(pitch)
+
+
+class RecordingSpeaker(NullSpeaker):
+    """Speaker that keeps every playback."""
+
+    def __init__(self):
+        self.played = []
+
+    def play(self, ys):
+        self.played.append(ys)
+
+
+class ToneThenSilence:
+    def __init__(self, freq=440, amp=0.5, duration=0.5):
+        """Signal that is a tone for the first duration seconds and digital
+        silence afterwards.
+        """
+        self.freq = freq
+        self.amp = amp
+        self.duration = duration
+
+    def evaluate(self, ts):
+        tone = self.amp * np.sin(2 * np.pi * self.freq * ts)
+        return np.where(ts < self.duration, tone, 0)
+
+
+class FailingDetector(asp.YIN):
+    @staticmethod
+    def get_pitch_freq(ys, samplerate=44100, out=None):
+        raise RuntimeError('detector failed')
+
+
+class SlowDetector(asp.YIN):
+    @staticmethod
+    def get_pitch_freq(ys, samplerate=44100, out=None):
+        time.sleep(0.05)
+        return asp.YIN.get_pitch_freq(ys, samplerate=samplerate, out=out)
+
+
+def listen_in_thread(detector, ui, timeout=10):
+    """Run detector.listen on a daemon thread, so a hang fails the test
+    instead of blocking it.
+
+    Return the exception raised by listen, or None
+    """
+    errors = []
+
+    def listen():
+        try:
+            detector.listen(ui)
+        except Exception as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=listen, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise AssertionError('listen did not return')
+    return errors[0] if errors else None
+
+
+class Test(unittest.TestCase):
+
+    def testDropOldestQueue(self):
+        items = DropOldestQueue(2)
+        for item in range(3):
+            items.put(item)
+
+        self.assertEqual(items.overruns, 1)
+        self.assertEqual(len(items), 2)
+        self.assertEqual(items.get(), 1)
+        self.assertEqual(items.get(), 2)
+        self.assertRaises(queue.Empty, items.get, timeout=0.01)
+
+    def testDropOldestQueueWakesConsumer(self):
+        items = DropOldestQueue(2)
+        timer = threading.Timer(0.05, items.put, args=('chunk',))
+        timer.start()
+        self.assertEqual(items.get(timeout=5), 'chunk')
+        timer.join()
+
+    def testListenRaisesAnalysisErrors(self):
+        source = SignalSource(thinkdsp.SinSignal(440, amp=0.5), duration=10)
+        detector = PitchDetector(FailingDetector, source=source)
+
+        error = listen_in_thread(detector, RecordingUI())
+        self.assertIsInstance(error, RuntimeError)
+        self.assertEqual(str(error), 'detector failed')
+
+    def testSlowDetectorDropsChunks(self):
+        # The source delivers chunks as fast as it can, much faster than
+        # the detector, and capture never waits for the analysis
+        source = SignalSource(thinkdsp.SinSignal(440, amp=0.5), duration=10)
+        detector = PitchDetector(SlowDetector, source=source)
+        ui = RecordingUI()
+
+        self.assertIsNone(listen_in_thread(detector, ui))
+        self.assertGreater(detector.chunks.overruns, 0)
+        self.assertTrue(ui.updates)
+        self.assertTrue(all(update.startswith('a3') for update in ui.updates))
+
+    def testDetectorListensToWavFile(self):
+        source = WavFileSource(PATHS.data / 'a4.wav', realtime=False)
+        detector = PitchDetector(asp.YIN, source=source)
+        ui = RecordingUI()
+
+        self.assertIsNone(listen_in_thread(detector, ui))
+        # The fade-out of the recording is too quiet to detect
+        pitches = [update for update in ui.updates if update != '-----']
+        self.assertTrue(pitches)
+        self.assertTrue(all(pitch.startswith('a3') for pitch in pitches))
+
+    def testDefaultMicrophone(self):
+        soundcard = mock.Mock()
+        with mock.patch.object(pitch_perfect, 'sc', soundcard), \
+             mock.patch.dict('sys.modules', soundcard=soundcard):
+            detector = PitchDetector(asp.YIN)
+
+        self.assertIsInstance(detector.default_mic, SoundcardSource)
+        self.assertIs(detector.default_mic.mic, soundcard.default_microphone.return_value)
+        self.assertIs(detector.default_speaker, soundcard.default_speaker.return_value)
+
+    def testTransferWithoutSoundcard(self):
+        source = SignalSource(ToneThenSilence(), duration=2)
+        with mock.patch.object(pitch_perfect, 'sc', None):
+            transfer = PitchTransfer(asp.YIN, source=source)
+        self.assertIsInstance(transfer.default_speaker, NullSpeaker)
+
+        transfer.should_wait_for_input = lambda timestamp: False
+        ui = RecordingUI()
+        transfer.listen(ui)
+        self.assertIn('Transferring', ui.updates)
+
+    def testTransferPlaysWhatItHeard(self):
+        source = SignalSource(ToneThenSilence(), duration=2)
+        speaker = RecordingSpeaker()
+        transfer = PitchTransfer(asp.YIN, source=source, speaker=speaker)
+        transfer.should_wait_for_input = lambda timestamp: False
+        transfer.listen(RecordingUI())
+
+        self.assertEqual(len(speaker.played), 1)
+        # The transfer starts with the pitch of the first chunk
+        ys = speaker.played[0][:transfer.numframes]
+        spectrum = thinkdsp.Wave(ys, framerate=transfer.samplerate).make_spectrum()
+        self.assertAlmostEqual(spectrum.fs[np.argmax(spectrum.amps)], 440, delta=spectrum.fs[1])
+
+    def testTransferStates(self):
+        samplerate, numframes = 8000, 500
+        speaker = RecordingSpeaker()
+        transfer = PitchTransfer(asp.YIN, samplerate=samplerate, numframes=numframes,
+                                 echo_duration=0.5, source=SignalSource(ToneThenSilence()),
+                                 speaker=speaker)
+        transfer.should_wait_for_input = lambda timestamp: False
+        ui = RecordingUI()
+        tone = thinkdsp.SinSignal(440, amp=0.5).make_wave(
+            duration=numframes / samplerate, framerate=samplerate).ys
+        silence = np.zeros(numframes)
+
+        for _ in range(3):
+            transfer.step(tone, speaker, ui)
+        self.assertEqual(transfer.state, LISTENING)
+        self.assertEqual(len(transfer.frequencies), 3)
+
+        # Loud until the half second window has slid past the tone
+        while transfer.state == LISTENING:
+            transfer.step(silence, speaker, ui)
+        self.assertEqual(transfer.state, FLUSHING)
+        self.assertEqual(len(speaker.played), 1)
+
+        # The playback and half a second of echo are flushed
+        played = len(speaker.played[0])
+        self.assertEqual(played, len(transfer.frequencies) * numframes)
+        self.assertEqual(transfer.frames_to_flush, played + samplerate // 2)
+
+        flushed = 0
+        while transfer.state == FLUSHING:
+            transfer.step(silence, speaker, ui)
+            flushed += numframes
+        self.assertEqual(flushed, played + samplerate // 2)
+        self.assertEqual(transfer.state, LISTENING)
+        self.assertEqual(transfer.frequencies, [])
+
+    def testTransferDropFrames(self):
+        transfer = PitchTransfer(asp.YIN, source=SignalSource(ToneThenSilence()), speaker=NullSpeaker())
+        transfer.drop_frames(1000)
+        self.assertEqual(transfer.state, LISTENING)
+
+        transfer.state, transfer.frames_to_flush = FLUSHING, 1500
+        transfer.drop_frames(1000)
+        self.assertEqual((transfer.state, transfer.frames_to_flush), (FLUSHING, 500))
+        transfer.drop_frames(1000)
+        self.assertEqual(transfer.state, LISTENING)
+
+
+if __name__ == '__main__':
+    unittest.main()
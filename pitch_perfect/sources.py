@@ -0,0 +1,194 @@
+"""Audio sources for the real-time apps.
+
+A source has the recorder interface of a soundcard microphone:
+
+    with source.recorder(samplerate=44100, channels=1) as mic:
+        ys = mic.record(numframes=11025)
+
+so it can stand in for `PitchDetectorAudioSystem.default_mic`. File and
+synthetic sources raise EOFError from `record` when they run out, and make
+`PitchDetector.listen` runnable headlessly, e.g. for load tests:
+
+    detector = PitchDetector(asp.YIN, source=WavFileSource('data/a4.wav'))
+"""
+import abc
+import time
+
+import numpy as np
+
+from pitch_perfect.thinkdsp import wavio
+
+
+class AudioSource(abc.ABC):
+    """Interface of an audio source."""
+
+    @abc.abstractmethod
+    def recorder(self, samplerate, channels=1):
+        """Return a context manager that opens the source and returns an
+        object with a record(numframes) method.
+
+        Args:
+            samplerate (int): Sample rate to record at
+            channels (int): Number of channels to record
+        """
+
+
+class SoundcardSource(AudioSource):
+    def __init__(self, name=None):
+        """Microphone of the soundcard module.
+
+        Args:
+            name (str): Name of the microphone. Default is the default
+                        microphone of the system.
+        """
+        import soundcard as sc
+
+        if name is None:
+            self.mic = sc.default_microphone()
+        else:
+            self.mic = sc.get_microphone(name)
+
+    def recorder(self, samplerate, channels=1):
+        return self.mic.recorder(samplerate=samplerate, channels=channels)
+
+
+class _Recorder:
+    def __init__(self, read, samplerate, channels, realtime):
+        """Paces and shapes the chunks of a non-device source.
+
+        Args:
+            read (callable): Return up to numframes mono samples or 
+                             (frames x channels) samples, or an empty array
+                             at the end of the source
+            realtime (bool): Return chunks no faster than real time
+        """
+        self.read = read
+        self.samplerate = samplerate
+        self.channels = channels
+        self.realtime = realtime
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        self.frames = 0
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def record(self, numframes):
+        """Return a (numframes x channels) chunk like soundcard does.
+
+        Raises EOFError at the end of the source.
+        """
+        ys = self.read(numframes)
+        if len(ys) == 0:
+            raise EOFError('End of audio source')
+
+        self.frames += len(ys)
+        if self.realtime:
+            delay = self.started + self.frames / self.samplerate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        if ys.ndim == 2 and ys.shape[1] == self.channels:
+            return ys
+        if ys.ndim == 2:
+            # Mix down to mono, then repeat it over the requested channels
+            ys = ys.mean(axis=1)
+        return np.repeat(ys[:, np.newaxis], self.channels, axis=1)
+
+
+class WavFileSource(AudioSource):
+    def __init__(self, filename, realtime=True, loop=False):
+        """Replays a WAV file, e.g. one of data/*.wav.
+
+        Args:
+            filename (str or Path): WAV file
+            realtime (bool): Pace the chunks at real time, or deliver them
+                             as fast as possible
+            loop (bool): Restart at the end of the file instead of ending
+        """
+        self.filename = str(filename)
+        self.realtime = realtime
+        self.loop = loop
+
+        with wavio.WavMap(self.filename) as wav:
+            self.samplerate = wav.framerate
+
+    def recorder(self, samplerate, channels=1):
+        if samplerate != self.samplerate:
+            raise ValueError(
+                f'{self.filename} is sampled at {self.samplerate} Hz, not {samplerate} Hz')
+        return _WavRecorder(self, channels)
+
+
+class _WavRecorder(_Recorder):
+    def __init__(self, source, channels):
+        super(_WavRecorder, self).__init__(
+            self._read, source.samplerate, channels, source.realtime)
+        self.source = source
+
+    def __enter__(self):
+        self.wav = wavio.WavMap(self.source.filename)
+        # Next frame to read
+        self.position = 0
+        return super(_WavRecorder, self).__enter__()
+
+    def __exit__(self, *exc):
+        self.wav.close()
+        return False
+
+    def _read(self, numframes):
+        if self.position >= len(self.wav) and self.source.loop:
+            self.position = 0
+
+        start = self.position
+        self.position = min(start + numframes, len(self.wav))
+        return self.wav.read(start, self.position)
+
+
+class SignalSource(AudioSource):
+    def __init__(self, signal, duration=None, realtime=False):
+        """Synthesizes audio from a thinkdsp.Signal, e.g. a CosSignal or
+        a SumSignal of several.
+
+        Args:
+            signal (thinkdsp.Signal): Signal to evaluate
+            duration (float): Seconds until the source ends. Default is
+                              endless.
+            realtime (bool): Pace the chunks at real time, or deliver them
+                             as fast as possible
+        """
+        self.signal = signal
+        self.duration = duration
+        self.realtime = realtime
+
+    def recorder(self, samplerate, channels=1):
+        total = None if self.duration is None else int(self.duration * samplerate)
+        position = 0
+
+        def read(numframes):
+            nonlocal position
+            if total is not None:
+                numframes = min(numframes, total - position)
+            ts = (position + np.arange(numframes)) / samplerate
+            position += numframes
+            return np.asarray(self.signal.evaluate(ts), dtype=np.float64)
+
+        return _Recorder(read, samplerate, channels, self.realtime)
+
+
+class NullSpeaker:
+    """Speaker that discards playback, for running PitchTransfer headlessly."""
+
+    def player(self, samplerate, channels=None):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def play(self, ys):
+        pass
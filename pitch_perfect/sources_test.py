@@ -0,0 +1,76 @@
+"""Tests for the audio sources of pitch_perfect.
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from pitch_perfect.config import PATHS
+from pitch_perfect.sources import SoundcardSource, WavFileSource
+from pitch_perfect.thinkdsp import wavio
+
+
+def record_all(source, samplerate, numframes, channels=1, limit=None):
+    chunks = []
+    with source.recorder(samplerate, channels=channels) as mic:
+        while limit is None or len(chunks) < limit:
+            try:
+                chunks.append(mic.record(numframes))
+            except EOFError:
+                break
+    return chunks
+
+
+class Test(unittest.TestCase):
+
+    def testWavFileSource(self):
+        filename = PATHS.data / 'a4.wav'
+        with wavio.WavMap(filename) as wav:
+            expected = wav.read()
+
+        chunks = record_all(WavFileSource(filename, realtime=False), 44100, 10000, channels=2)
+        self.assertEqual([len(chunk) for chunk in chunks[:-1]], [10000] * (len(chunks) - 1))
+        self.assertTrue(np.array_equal(np.concatenate(chunks), expected))
+
+    def testWavFileSourceFloat(self):
+        ys = 0.5 * np.sin(2 * np.pi * 440 * np.arange(1000) / 8000)
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'capture.wav')
+            with wavio.WavWriter(filename, 8000, sample_format='float32') as writer:
+                writer.write(ys)
+
+            source = WavFileSource(filename, realtime=False)
+            self.assertEqual(source.samplerate, 8000)
+            chunks = record_all(source, 8000, 300)
+
+        self.assertEqual([len(chunk) for chunk in chunks], [300, 300, 300, 100])
+        self.assertTrue(np.allclose(np.concatenate(chunks)[:, 0], ys, atol=1e-7))
+
+    def testWavFileSourceLoop(self):
+        ys = np.linspace(-0.5, 0.5, 500)
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'loop.wav')
+            with wavio.WavWriter(filename, 8000, sample_format='float32') as writer:
+                writer.write(ys)
+
+            source = WavFileSource(filename, realtime=False, loop=True)
+            chunks = record_all(source, 8000, 400, limit=3)
+
+        self.assertEqual([len(chunk) for chunk in chunks], [400, 100, 400])
+        self.assertTrue(np.allclose(chunks[2][:, 0], ys[:400]))
+
+    def testSoundcardSourceDefaultMicrophone(self):
+        soundcard = mock.Mock()
+        with mock.patch.dict('sys.modules', soundcard=soundcard):
+            source = SoundcardSource()
+        self.assertIs(source.mic, soundcard.default_microphone.return_value)
+
+        source.recorder(44100, channels=2)
+        source.mic.recorder.assert_called_once_with(samplerate=44100, channels=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
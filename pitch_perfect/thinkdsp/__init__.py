@@ -1,3 +1,4 @@
 from . import thinkdsp
 from . import thinkplot
-from . import asp
\ No newline at end of file
+from . import asp
+from . import wavio
@@ -1,6 +1,14 @@
 
+import abc
+from collections import namedtuple
+from functools import lru_cache
+
 import numpy as np
-from pitch_perfect.data import FREQUENCY_KEY_MAP, FREQUENCY_ARRAY
+import scipy.ndimage
+import scipy.signal
+import scipy.sparse
+from pitch_perfect.data import SORTED_KEY_ARRAY, SORTED_FREQUENCY_ARRAY, SORTED_MIDI_ARRAY
+from pitch_perfect.thinkdsp.wavio import WavMap, wav_blocks
 
 
 def get_sound_pressure_level(ys, p0=2E-6):
@@ -13,9 +21,166 @@ def get_sound_pressure_level(ys, p0=2E-6):
                     Default value is the commonly used 20 micropascals.
 
     """
+    ys = np.ravel(ys)
     n = len(ys)
-    p = np.sqrt(np.sum(ys ** 2) / n)
-    return 20 * np.log10(p / p0)
+    return mean_square_to_spl(np.dot(ys, ys) / n, p0=p0)
+
+
+def mean_square_to_spl(mean_square, p0=2E-6):
+    """Sound pressure level from the mean square of a signal. 
+    Digital silence gives -inf without a warning.
+
+    Args:
+        mean_square (float or np.array): Mean of the squared samples
+        p0 (float): Reference sound pressure.
+    """
+    with np.errstate(divide='ignore'):
+        return 10 * np.log10(np.maximum(mean_square, 0) / p0 ** 2)
+
+
+class RingBuffer:
+    def __init__(self, capacity):
+        """Fixed-size window over the latest audio samples with a running 
+        sum of squares, so the loudness of the window is available without
+        recomputing it from every sample. The window starts filled with 
+        zeros.
+
+        Args:
+            capacity (int): Number of samples in the window, 
+                            e.g. samplerate // 2 for the last half second.
+        """
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity)
+        self.reset()
+
+    def reset(self):
+        """Fill the window with zeros again."""
+        self.buffer[:] = 0
+        self.index = 0
+        self.sum_of_squares = 0.0
+        # Samples written since the running sum was last recomputed
+        self._since_refresh = 0
+
+    def __len__(self):
+        return self.capacity
+
+    def extend(self, ys):
+        """Append a chunk, dropping the oldest samples. Costs O(len(ys)).
+
+        Args:
+            ys (np.array): Audio chunk
+        """
+        ys = np.ravel(ys)
+        n = len(ys)
+        if n >= self.capacity:
+            self.buffer[:] = ys[n - self.capacity:]
+            self.index = 0
+            self._refresh()
+            return
+
+        head = min(n, self.capacity - self.index)
+        tail = n - head
+        old_head = self.buffer[self.index:self.index + head]
+        old_tail = self.buffer[:tail]
+        self.sum_of_squares -= np.dot(old_head, old_head) + np.dot(old_tail, old_tail)
+
+        old_head[:] = ys[:head]
+        old_tail[:] = ys[head:]
+        self.sum_of_squares += np.dot(ys, ys)
+        self.index = (self.index + n) % self.capacity
+
+        # Bound the rounding error of the running sum by recomputing it
+        # once per window, which is O(1) per sample amortized.
+        self._since_refresh += n
+        if self._since_refresh >= self.capacity:
+            self._refresh()
+
+    def _refresh(self):
+        self.sum_of_squares = float(np.dot(self.buffer, self.buffer))
+        self._since_refresh = 0
+
+    def values(self):
+        """Return a copy of the window in chronological order."""
+        return np.roll(self.buffer, -self.index)
+
+    @property
+    def mean_square(self):
+        return max(self.sum_of_squares, 0.0) / self.capacity
+
+    def get_sound_pressure_level(self, p0=2E-6):
+        """Sound pressure level of the window. See `get_sound_pressure_level`.
+        """
+        return mean_square_to_spl(self.mean_square, p0=p0)
+
+
+# Time constants in seconds of the standard exponential time weightings
+TIME_WEIGHTINGS = {'fast': 0.125, 'slow': 1.0}
+
+
+class SPLMeter:
+    def __init__(self, samplerate=44100, windows=(0.05, 0.25, 1.0), 
+                 mode='window', p0=2E-6):
+        """Stateful sound pressure level meter updated chunk by chunk in 
+        O(chunk), for several windows at once.
+
+        Args:
+            samplerate (int): Sample rate of the chunks
+            windows (tuple): Window lengths in seconds for mode='window', or
+                             time constants in seconds or names of 
+                             TIME_WEIGHTINGS for mode='exponential'
+            mode (str): 'window' for the mean square over the latest samples,
+                        'exponential' for exponentially time-weighted levels
+            p0 (float): Reference sound pressure.
+        """
+        if mode not in ('window', 'exponential'):
+            raise ValueError(f'Unknown SPL meter mode: {mode}')
+
+        self.samplerate = samplerate
+        self.windows = windows
+        self.mode = mode
+        self.p0 = p0
+
+        if mode == 'window':
+            self.rings = [RingBuffer(max(1, int(round(w * samplerate)))) for w in windows]
+        else:
+            taus = np.array([TIME_WEIGHTINGS.get(w, w) for w in windows], dtype=np.float64)
+            # Per-sample decay of the exponential average
+            self.decays = np.exp(-1 / (taus * samplerate))
+            self.mean_squares = np.zeros(len(windows))
+            self._weights = {}
+
+    def _chunk_weights(self, n):
+        """Weights of the squared samples of an n-sample chunk in the 
+        exponential average, newest last. Cached per chunk length.
+        """
+        if n not in self._weights:
+            ages = np.arange(n - 1, -1, -1)
+            self._weights[n] = (1 - self.decays[:, np.newaxis]) * self.decays[:, np.newaxis] ** ages
+        return self._weights[n]
+
+    def update(self, ys):
+        """Feed a chunk and return the levels, see `levels`.
+
+        Args:
+            ys (np.array): Audio chunk
+        """
+        ys = np.ravel(ys)
+        if self.mode == 'window':
+            for ring in self.rings:
+                ring.extend(ys)
+        elif len(ys):
+            self.mean_squares *= self.decays ** len(ys)
+            self.mean_squares += self._chunk_weights(len(ys)) @ (ys * ys)
+        return self.levels
+
+    @property
+    def levels(self):
+        """Sound pressure levels in dB, one per window. -inf in silence."""
+        if self.mode == 'window':
+            mean_squares = np.array([ring.mean_square for ring in self.rings])
+        else:
+            mean_squares = self.mean_squares
+        return mean_square_to_spl(mean_squares, p0=self.p0)
 
 
 def is_quiet(spl, threshold=60):
@@ -30,14 +195,449 @@ def is_quiet(spl, threshold=60):
     return spl < threshold
 
 
+# A frequency belongs to the nearest note on a log scale, so the boundary
+# between neighbouring notes is their geometric mean.
+_NOTE_BOUNDARIES = np.sqrt(SORTED_FREQUENCY_ARRAY[1:] * SORTED_FREQUENCY_ARRAY[:-1])
+# Half a semitone beyond the lowest and highest notes
+_LOWEST_FREQ = SORTED_FREQUENCY_ARRAY[0] * 2 ** (-1 / 24)
+_HIGHEST_FREQ = SORTED_FREQUENCY_ARRAY[-1] * 2 ** (1 / 24)
+_KEY_OBJECT_ARRAY = SORTED_KEY_ARRAY.astype(object)
+
+
+def _note_indices(freqs):
+    """Index into the sorted note table per frequency, and a mask of the
+    frequencies that are NaN or out of range of the table.
+    """
+    freqs = np.asarray(freqs, dtype=np.float64)
+    indices = np.searchsorted(_NOTE_BOUNDARIES, freqs)
+    with np.errstate(invalid='ignore'):
+        invalid = ~((freqs >= _LOWEST_FREQ) & (freqs <= _HIGHEST_FREQ))
+    return indices, invalid
+
+
 def freq2key(freq):
-    return FREQUENCY_KEY_MAP[
-        FREQUENCY_ARRAY[
-            np.argmin(
-                np.abs(FREQUENCY_ARRAY - freq)
-                )
-            ]
-        ]
+    """Return the name of the nearest note, or None if freq is NaN or out 
+    of the range of the note table.
+    """
+    index, invalid = _note_indices(freq)
+    return None if invalid else SORTED_KEY_ARRAY[index]
+
+
+def freqs2keys(freqs):
+    """Vectorized `freq2key` over an array of frequencies.
+    """
+    return freqs2notes(freqs)[0]
+
+
+def freqs2notes(freqs):
+    """Map an array of frequencies to the nearest notes.
+
+    Args:
+        freqs (np.array): Frequencies in Hz
+
+    Return note names, MIDI numbers and deviations in cents from the notes.
+    Names are None and MIDI numbers and cents are NaN where the frequency 
+    is NaN or out of the range of the note table.
+    """
+    freqs = np.asarray(freqs, dtype=np.float64)
+    indices, invalid = _note_indices(freqs)
+
+    keys = np.where(invalid, None, _KEY_OBJECT_ARRAY[indices])
+    midi = np.where(invalid, np.nan, SORTED_MIDI_ARRAY[indices])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cents = 1200 * np.log2(freqs / SORTED_FREQUENCY_ARRAY[indices])
+    cents = np.where(invalid, np.nan, cents)
+    return keys, midi, cents
+
+
+def frame_signal(ys, frame_length, hop_length=None):
+    """Strided (frames x samples) view of a long 1-D signal. No samples are
+    copied, so the view must be treated as read-only.
+
+    Args:
+        ys (np.array): 1-D signal, or (channels x samples) array which 
+                       gives a (channels x frames x samples) view
+        frame_length (int): Number of samples per frame
+        hop_length (int): Number of samples between frame starts. 
+                          Default is frame_length, i.e. no overlap.
+    """
+    ys = np.asarray(ys)
+    hop_length = frame_length if hop_length is None else hop_length
+    length = ys.shape[-1]
+    if length < frame_length:
+        return np.empty(ys.shape[:-1] + (0, frame_length), dtype=ys.dtype)
+
+    num_frames = 1 + (length - frame_length) // hop_length
+    stride = ys.strides[-1]
+    return np.lib.stride_tricks.as_strided(
+        ys, 
+        shape=ys.shape[:-1] + (num_frames, frame_length), 
+        strides=ys.strides[:-1] + (hop_length * stride, stride),
+        writeable=False
+        )
+
+
+class Decimator:
+    def __init__(self, samplerate=44100, target_samplerate=11025, taps_per_phase=16):
+        """Anti-aliased streaming decimation by an integer factor, so pitch
+        detection can run at a reduced sample rate. 
+
+        The factor is the largest integer that keeps the output rate at or
+        above target_samplerate. A low-pass FIR filter is evaluated only at 
+        the kept output samples (polyphase form), and the filter history is
+        carried across chunks so consecutive chunks decimate seamlessly.
+
+        Args:
+            samplerate (int): Sample rate of the input chunks
+            target_samplerate (int): Lowest acceptable output sample rate
+            taps_per_phase (int): Filter length per decimation phase. 
+                                  Longer filters give a sharper cutoff.
+        """
+        self.factor = max(1, samplerate // target_samplerate)
+        self.samplerate = samplerate / self.factor
+
+        numtaps = taps_per_phase * self.factor + 1
+        # Cut off below the new Nyquist frequency to leave a transition band
+        taps = scipy.signal.firwin(
+            numtaps, cutoff=0.8 * self.samplerate / 2, fs=samplerate)
+        self.taps = taps[::-1].copy()
+        self.reset()
+
+    def reset(self):
+        """Forget the filter history, e.g. after a gap in the input."""
+        # Allocated by the first chunk, which tells the number of channels
+        self.pending = None
+
+    def decimate(self, ys):
+        """
+        Args:
+            ys (np.array): Chunk at the input sample rate. Either mono, or 
+                           (frames x channels) which decimates every channel.
+
+        Return the chunk at `self.samplerate`
+        """
+        ys = np.asarray(ys)
+        if ys.ndim < 2 or ys.shape[1] == 1:
+            ys = np.ravel(ys)
+        if self.factor == 1:
+            return ys
+
+        # Channels x samples, so samples are framed along the last axis
+        ys = ys.T
+        if self.pending is None:
+            self.pending = np.zeros(ys.shape[:-1] + (len(self.taps) - 1,))
+
+        self.pending = np.concatenate((self.pending, ys), axis=-1)
+        frames = frame_signal(self.pending, len(self.taps), self.factor)
+        decimated = frames @ self.taps
+        self.pending = self.pending[..., frames.shape[-2] * self.factor:]
+        return decimated.T
+
+
+def overlap_add(frames, hop_length, out):
+    """Add (frames x samples) into out, frame i starting at i * hop_length.
+
+    Each frame is added as ceil(frame_length / hop_length) pieces, and the
+    pieces at one offset never overlap, so every piece is one vectorized 
+    add into a strided view of out.
+
+    Args:
+        frames (np.array): (frames x samples) array
+        hop_length (int): Number of samples between frame starts
+        out (np.array): 1-D array of at least 
+                        (frames - 1) * hop_length + frame_length samples
+    """
+    num_frames, frame_length = frames.shape
+    stride = out.strides[0]
+    for first in range(0, frame_length, hop_length):
+        piece = frames[:, first:first+hop_length]
+        target = np.lib.stride_tricks.as_strided(
+            out[first:], shape=piece.shape, strides=(hop_length * stride, stride))
+        target += piece
+
+
+class OverlapAdd:
+    def __init__(self, frame_length, hop_length, window=None):
+        """Streaming weighted overlap-add, the inverse of framing a signal
+        with frame_signal and multiplying by an analysis window.
+
+        Frames are multiplied by the window again and normalized by the 
+        overlapping sum of the squared window, which reconstructs the 
+        signal exactly where frames overlap and never divides by a window
+        edge. Samples that no later frame can change are returned right 
+        away; the rest are carried to the next call.
+
+        Args:
+            frame_length (int): Number of samples per frame
+            hop_length (int): Number of samples between frame starts
+            window (np.array): Analysis window, default is none 
+                               (rectangular)
+        """
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        self.window = np.ones(frame_length) if window is None else np.asarray(window)
+        self.reset()
+
+    def reset(self):
+        # Weighted sums and window normalization of unfinished samples
+        self.pending = np.zeros(0)
+        self.norm = np.zeros(0)
+
+    def add(self, frames):
+        """
+        Args:
+            frames (np.array): (frames x samples) time-domain frames
+
+        Return the samples that are complete
+        """
+        frames = np.asarray(frames)
+        num_frames = len(frames)
+        if num_frames == 0:
+            return np.zeros(0)
+
+        # The next frame starts here
+        done = num_frames * self.hop_length
+        length = max(done - self.hop_length + self.frame_length, done, len(self.pending))
+        pending = np.zeros(length, dtype=np.result_type(frames, np.float64))
+        norm = np.zeros(length)
+        pending[:len(self.pending)] = self.pending
+        norm[:len(self.norm)] = self.norm
+
+        overlap_add(frames * self.window, self.hop_length, pending)
+        squares = np.broadcast_to(self.window ** 2, frames.shape)
+        overlap_add(squares, self.hop_length, norm)
+
+        self.pending, self.norm = pending[done:], norm[done:]
+        return self._normalize(pending[:done], norm[:done])
+
+    def flush(self):
+        """Return the remaining samples and reset."""
+        ys = self._normalize(self.pending, self.norm)
+        self.reset()
+        return ys
+
+    @staticmethod
+    def _normalize(ys, norm):
+        # Samples no window covers are zero
+        return np.divide(ys, norm, out=np.zeros_like(ys), where=norm > 1e-10)
+
+
+class ConstantQ:
+    def __init__(self, samplerate=44100, hop_length=None, frame_length=None,
+                 keys=None, q_factor=1.0, sparsity=0.01):
+        """Constant-Q transform with one bin per note of the key table, so
+        low notes get long analysis windows and high notes short ones.
+
+        Every note has a Hann windowed complex exponential of Q periods,
+        centered in the frame. Their spectra are precomputed into a sparse
+        (keys x FFT bins) kernel, so a frame costs one rfft and one sparse
+        matrix product:
+
+            cq = ConstantQ(44100, hop_length=2048)
+            energy = np.abs(cq.batch(ys)) ** 2   # keys x frames
+
+        A sinusoid of amplitude A at the frequency of a note gives a 
+        coefficient of magnitude A in its bin.
+
+        Args:
+            samplerate (int): Sample rate of the signal
+            hop_length (int): Number of samples between frame starts. 
+                              Default is a quarter of a frame.
+            frame_length (int): Number of samples per frame. Default is the 
+                                power of two that fits the longest kernel;
+                                shorter frames shorten the kernels of low 
+                                notes and widen their bins.
+            keys (list): Note names to analyse. Default is every note of 
+                         the key table below the Nyquist frequency.
+            q_factor (float): Scales the kernel lengths. 1 gives bins one 
+                              semitone wide.
+            sparsity (float): Kernel values below this fraction of the 
+                              largest value of their bin are dropped
+        """
+        if keys is None:
+            keys = SORTED_KEY_ARRAY[SORTED_FREQUENCY_ARRAY < samplerate / 2]
+        index = {key: i for i, key in enumerate(SORTED_KEY_ARRAY)}
+        indices = [index[key] for key in keys]
+        self.keys = SORTED_KEY_ARRAY[indices]
+        self.freqs = SORTED_FREQUENCY_ARRAY[indices]
+        self.samplerate = samplerate
+
+        q = q_factor / (2 ** (1 / 12) - 1)
+        lengths = np.ceil(q * samplerate / self.freqs).astype(int)
+        if frame_length is None:
+            frame_length = 1 << int(lengths.max() - 1).bit_length()
+        self.frame_length = frame_length
+        self.hop_length = frame_length // 4 if hop_length is None else hop_length
+        lengths = np.minimum(lengths, frame_length)
+
+        self.kernel = self._make_kernel(lengths, sparsity)
+        self.reset()
+
+    def _make_kernel(self, lengths, sparsity):
+        rows = []
+        for freq, length in zip(self.freqs, lengths):
+            window = np.hanning(length)
+            ns = np.arange(length) - (length - 1) / 2
+            # Scaled so a unit sinusoid gives a unit coefficient
+            temporal = np.zeros(self.frame_length, dtype=complex)
+            first = (self.frame_length - length) // 2
+            temporal[first:first+length] = (
+                2 * window / window.sum() * np.exp(2j * np.pi * freq * ns / self.samplerate))
+
+            # By Parseval, the inner product with a frame is the inner 
+            # product of the spectra over frame_length. The kernel is 
+            # analytic, so the positive frequencies of rfft suffice.
+            spectral = np.conj(np.fft.fft(temporal)[:self.frame_length // 2 + 1]) / self.frame_length
+            spectral[np.abs(spectral) < sparsity * np.abs(spectral).max()] = 0
+            rows.append(spectral)
+
+        return scipy.sparse.csr_matrix(np.array(rows))
+
+    def transform(self, frames):
+        """
+        Args:
+            frames (np.array): (frames x frame_length) array, e.g. from 
+                               frame_signal
+
+        Return (keys x frames) complex coefficients
+        """
+        spectra = np.fft.rfft(frames, n=self.frame_length, axis=-1)
+        return np.asarray(self.kernel @ spectra.T)
+
+    def batch(self, ys, block_size=64):
+        """Transform a whole 1-D signal, block_size frames at a time.
+
+        Frame i starts at sample i * hop_length; its coefficients describe 
+        the signal around the center of the frame.
+
+        Return (keys x frames) complex coefficients
+        """
+        frames = frame_signal(ys, self.frame_length, self.hop_length)
+        blocks = [self.transform(frames[i:i+block_size]) 
+                  for i in range(0, len(frames), block_size)]
+        if not blocks:
+            return np.zeros((len(self.keys), 0), dtype=complex)
+        return np.concatenate(blocks, axis=1)
+
+    def reset(self):
+        """Forget the buffered samples of the stream."""
+        self.pending = np.zeros(0)
+
+    def update(self, ys):
+        """Streaming mode: buffer a chunk and transform every frame it 
+        completes. Frames follow each other as in batch.
+
+        Args:
+            ys (np.array): 1-D chunk
+
+        Return (keys x frames) complex coefficients, possibly of no frames
+        """
+        self.pending = np.concatenate((self.pending, np.ravel(ys)))
+        frames = frame_signal(self.pending, self.frame_length, self.hop_length)
+        self.pending = self.pending[len(frames) * self.hop_length:]
+        return self.transform(frames)
+
+
+class MultiPitch:
+    def __init__(self, samplerate=44100, hop_length=None, max_notes=6, 
+                 threshold=0.2, floor=0.01, num_harmonics=8, harmonic_decay=0.7,
+                 **cq_options):
+        """Polyphonic pitch estimation by iterative harmonic subtraction 
+        on the constant-Q spectrum.
+
+        Every note has a template: the ConstantQ magnitudes of a harmonic 
+        tone with decaying partials, including what leaks into neighbouring
+        bins. Each iteration picks, in every frame at once, the note whose 
+        template best matches the remaining spectrum, and subtracts the 
+        template scaled to the note's amplitude, until max_notes are found
+        or the strongest remaining note is too quiet.
+
+            mp = MultiPitch(44100, hop_length=2048)
+            for notes in mp.batch(ys):
+                print(sorted(notes))
+
+        Args:
+            samplerate (int): Sample rate of the signal
+            hop_length (int): Number of samples between frames, see ConstantQ
+            max_notes (int): Most notes reported per frame
+            threshold (float): Lowest amplitude of a note relative to the 
+                               loudest bin of its frame
+            floor (float): Lowest amplitude of a note, which keeps silence
+                           from producing notes
+            num_harmonics (int): Number of partials of the templates
+            harmonic_decay (float): Amplitude ratio of consecutive partials
+            cq_options: More arguments of ConstantQ
+        """
+        self.cq = ConstantQ(samplerate, hop_length=hop_length, **cq_options)
+        self.keys = self.cq.keys
+        self.max_notes = max_notes
+        self.threshold = threshold
+        self.floor = floor
+        self.templates = self._make_templates(num_harmonics, harmonic_decay)
+
+    def _make_templates(self, num_harmonics, harmonic_decay):
+        """(keys x notes) ConstantQ magnitudes of a harmonic tone per note,
+        with 1 in the bin of the note itself."""
+        ts = np.arange(self.cq.frame_length) / self.cq.samplerate
+        harmonics = np.arange(1, num_harmonics + 1)
+        tones = np.zeros((len(self.keys), len(ts)))
+        for tone, freq in zip(tones, self.cq.freqs):
+            for harmonic in harmonics[harmonics * freq < self.cq.samplerate / 2]:
+                tone += harmonic_decay ** (harmonic - 1) * np.cos(2 * np.pi * harmonic * freq * ts)
+
+        templates = np.abs(self.cq.transform(tones))
+        return templates / np.diag(templates)
+
+    def estimate(self, amps):
+        """
+        Args:
+            amps (np.array): (keys x frames) ConstantQ magnitudes
+
+        Return (keys x frames) boolean array of active notes
+        """
+        remaining = np.array(amps, dtype=np.float64)
+        active = np.zeros(remaining.shape, dtype=bool)
+        frames = np.arange(remaining.shape[1])
+        level = np.maximum(self.threshold * remaining.max(axis=0), self.floor)
+        searching = np.ones(len(frames), dtype=bool)
+
+        for _ in range(self.max_notes):
+            salience = self.templates.T @ remaining
+            # A note needs its fundamental, which keeps subharmonics out
+            salience[(remaining < level) | active] = 0
+            notes = np.argmax(salience, axis=0)
+            searching &= salience[notes, frames] > 0
+            if not searching.any():
+                break
+
+            found, frames_found = notes[searching], frames[searching]
+            active[found, frames_found] = True
+            amps_found = remaining[found, frames_found]
+            remaining[:, frames_found] -= self.templates[:, found] * amps_found
+            np.maximum(remaining, 0, out=remaining)
+
+        return active
+
+    def notes(self, active):
+        """List of sets of note names, one per frame of an estimate."""
+        return [set(self.keys[column]) for column in active.T]
+
+    def batch(self, ys):
+        """Active notes of every frame of a 1-D signal, see ConstantQ.batch.
+
+        Return list of sets of note names
+        """
+        return self.notes(self.estimate(np.abs(self.cq.batch(ys))))
+
+    def reset(self):
+        self.cq.reset()
+
+    def update(self, ys):
+        """Streaming mode, see ConstantQ.update.
+
+        Return list of sets of note names of the frames the chunk completes
+        """
+        return self.notes(self.estimate(np.abs(self.cq.update(ys))))
 
 
 def get_pitch_freq(ys):
@@ -54,15 +654,250 @@ def get_pitch_freq(ys):
     finally:
         return pitch, freq
 
-class PitchAnalysis:
+def difference_reference(ys):
+    """Difference function of YIN by direct summation over every lag. 
+    It is O(N^2) and kept as a reference for `difference_fft`.
+
+    Args:
+        ys (np.array): 1-D signal
+    """
+    N = len(ys)    
+    return np.array(
+        [ np.sum(
+            ( ys[lag:] - ys[:N-lag] ) ** 2
+            ) for lag in range(N//2) ]
+        )
+
+
+def difference_fft(ys):
+    """Difference function of YIN in O(N log N).
+
+    The squared difference expands into two energy terms and an
+    autocorrelation term:
+        d(lag) = sum(ys[lag:] ** 2) + sum(ys[:N-lag] ** 2) - 2 * r(lag)
+    The energy terms come from a cumulative sum and r(lag) from rfft.
+
+    Args:
+        ys (np.array): 1-D signal, or frames stacked along the first axis.
+    """
+    ys = np.asarray(ys, dtype=np.float64)
+    N = ys.shape[-1]
+    lags = np.arange(N//2)
+
+    energy = np.zeros(ys.shape[:-1] + (N + 1,))
+    np.cumsum(ys ** 2, axis=-1, out=energy[..., 1:])
+    corrs = autocorrelation_fft(ys, N//2)
+
+    diffs = energy[..., N:] - energy[..., lags] + energy[..., N - lags] - 2 * corrs
+    # Rounding error of the FFT may leave tiny negative values
+    return np.maximum(diffs, 0, out=diffs)
+
+
+def autocorrelation_fft(ys, num_lags):
+    """Unnormalized autocorrelation r(lag) = sum(ys[:N-lag] * ys[lag:]) for
+    lags [0, num_lags) via rfft.
+
+    Args:
+        ys (np.array): 1-D signal, or frames stacked along the first axis.
+        num_lags (int): Number of lags to return
+    """
+    N = ys.shape[-1]
+    # Zero pad to avoid circular wrap-around of the correlation
+    size = 2 ** int(np.ceil(np.log2(2 * N)))
+    spectrum = np.fft.rfft(ys, n=size, axis=-1)
+    return np.fft.irfft(spectrum * spectrum.conj(), n=size, axis=-1)[..., :num_lags]
+
+
+@lru_cache(maxsize=8)
+def _lags(n):
+    """Read-only lag indices [1, n) shared across calls."""
+    lags = np.arange(1, n, dtype=np.float64)
+    lags.flags.writeable = False
+    return lags
+
+
+def cumulative_mean_normalized(diffs, out=None):
+    """Cumulative mean normalized difference of YIN, vectorized over lags
+    with a running cumulative sum:
+        cmn[lag] = diffs[lag] / (sum(diffs[1:lag+1]) / lag),  cmn[0] = 1
+
+    Lags whose running sum is zero (digital silence) are set to 1.
+
+    Args:
+        diffs (np.array): Difference over range of lags. Frames may be 
+                          stacked along the first axis.
+        out (np.array): Optional preallocated output of the same shape as
+                        diffs. Real-time loops pass the same buffer for every
+                        chunk to avoid an allocation.
+    """
+    diffs = np.asarray(diffs, dtype=np.float64)
+    if out is None:
+        out = np.empty(diffs.shape)
+    elif out.shape != diffs.shape:
+        raise ValueError(
+            f'Output buffer has shape {out.shape}, expected {diffs.shape}')
+
+    running = out[..., 1:]
+    np.cumsum(diffs[..., 1:], axis=-1, out=running)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(_lags(diffs.shape[-1]), running, out=running)
+        running *= diffs[..., 1:]
+    running[~np.isfinite(running)] = 1
+    out[..., 0] = 1
+    return out
+
+
+def parabolic_interpolation(ys, indices):
+    """Refine integer indices of local extrema to fractional ones by fitting
+    a parabola through each index and its two neighbours.
+
+    Args:
+        ys (np.array): (frames x values) array
+        indices (np.array): Integer index per frame
+
+    Return fractional indices
+    """
+    ys = np.atleast_2d(ys)
+    rows = np.arange(len(ys))
+    # Edge indices have no neighbour on one side and stay as they are
+    inner = np.clip(indices, 1, ys.shape[-1] - 2)
+    left = ys[rows, inner - 1]
+    center = ys[rows, inner]
+    right = ys[rows, inner + 1]
+
+    curvature = left - 2 * center + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = 0.5 * (left - right) / curvature
+    shift[~np.isfinite(shift) | (inner != indices)] = 0
+    return indices + np.clip(shift, -0.5, 0.5)
+
+
+def absolute_threshold_frames(cmn, threshold=0.1, interpolate=True):
+    """Vectorized absolute threshold over frames of cumulative mean 
+    normalized differences.
+
+    For each frame the lag is the minimum of the first dip below threshold.
+    Frames without such a dip fall back to the global minimum, excluding 
+    lags 0 and 1. Lags are never below 2, which is the Nyquist frequency.
+
+    Args:
+        cmn (np.array): (frames x lags) cumulative mean normalized difference
+        interpolate (bool): Refine the lags with parabolic interpolation
+
+    Return lags and confidences (1 - cmn at the lag) per frame
+    """
+    cmn = np.atleast_2d(cmn)
+    lags = np.arange(cmn.shape[-1])
+
+    below = cmn < threshold
+    has_dip = below.any(axis=-1)
+    first_dip_start = np.argmax(below, axis=-1)[:, np.newaxis]
+
+    after_start = lags >= first_dip_start
+    # A dip lasts until cmn rises above the threshold again
+    in_dip = after_start & (np.cumsum(after_start & (cmn > threshold), axis=-1) == 0)
+    # cmn is 1 at lags 0 and 1 by definition
+    in_dip[~has_dip] = lags[np.newaxis, :] > 1
+
+    best_lags = np.argmin(np.where(in_dip, cmn, np.inf), axis=-1)
+    best_cmn = cmn[np.arange(len(cmn)), best_lags]
+    confidences = np.clip(1 - best_cmn, 0, 1)
+    if interpolate:
+        # The fit of lag 2 leans on the fixed cmn of lag 1, and must not 
+        # move past the Nyquist frequency
+        best_lags = np.maximum(parabolic_interpolation(cmn, best_lags), 2)
+    return best_lags, confidences
+
+
+def threshold_freqs(cmn, samplerate=44100, threshold=0.1):
+    """Freqs and confidences of the absolute threshold of every frame, see
+    absolute_threshold_frames. Freqs are NaN for frames without a dip 
+    below threshold, e.g. digital silence where cmn is flat.
+
+    Args:
+        cmn (np.array): (frames x lags) cumulative mean normalized differences
+        samplerate (int): Sample rate of the frames
+    """
+    cmn = np.atleast_2d(cmn)
+    lags, confidences = absolute_threshold_frames(cmn, threshold=threshold)
+    freqs = samplerate / lags
+    freqs[~(cmn < threshold).any(axis=-1)] = np.nan
+    return freqs, confidences
+
+
+class PitchAnalysis(abc.ABC):
     def __init__(self, ys, samplerate=44100):
         """
         Args:
             ys (np.array): Small audio chunk.
         """
-        self.ys = ys
+        ys = np.asarray(ys)
+        if ys.ndim > 2 or (ys.ndim == 2 and min(ys.shape) > 1):
+            raise ValueError(
+                f'PitchAnalysis: expected a mono chunk, got shape {ys.shape}; '
+                'use get_pitch_freqs on the (channels x samples) transpose')
+        # Recorders return (frames, channels) even for a mono chunk
+        self.ys = np.ravel(ys)
         self.samplerate = samplerate
 
+    @staticmethod
+    def lag_count(n):
+        """Number of lags analysed for a chunk of n samples. Use it to size
+        the `out` buffer of `get_pitch_freq`.
+        """
+        return n // 2
+
+    @classmethod
+    def get_pitch_freqs(cls, frames, samplerate=44100, threshold=0.1, 
+                        block_size=256):
+        """Return pitches, freqs and confidences of many chunks for offline 
+        use. Frames are analysed block_size at a time so the intermediate 
+        arrays stay bounded for arbitrarily long inputs.
+
+        Args:
+            frames (np.array): (frames x samples) array, e.g. `frame_signal`
+                               of a long recording. A (channels x samples) 
+                               chunk analyses every channel at once, and a 
+                               (channels x frames x samples) array gives 
+                               (channels x frames) results.
+            samplerate (int): Sample rate of the frames
+            block_size (int): Number of frames analysed in one vectorized pass
+        """
+        frames = np.atleast_2d(frames)
+        if frames.ndim > 2:
+            # Strided views can't be reshaped without a copy, so analyse the
+            # leading dimensions one at a time
+            results = [
+                cls.get_pitch_freqs(frames[index], samplerate, threshold, block_size)
+                for index in np.ndindex(frames.shape[:-2])
+            ]
+            return tuple(
+                np.reshape([result[i] for result in results], frames.shape[:-1])
+                for i in range(3)
+            )
+
+        num_frames = len(frames)
+        freqs = np.empty(num_frames)
+        confidences = np.empty(num_frames)
+
+        for start in range(0, num_frames, block_size):
+            end = start + block_size
+            freqs[start:end], confidences[start:end] = cls.frame_freqs(
+                frames[start:end], samplerate=samplerate, threshold=threshold)
+
+        return freqs2keys(freqs), freqs, confidences
+
+    @classmethod
+    @abc.abstractmethod
+    def frame_freqs(cls, frames, samplerate=44100, threshold=0.1):
+        """Return freqs and confidences of a block of frames. Every detector
+        implements it for the batch API; freqs are NaN where no pitch is 
+        found.
+
+        Args:
+            frames (np.array): (frames x samples) array
+        """
+
 class Autocorrelation(PitchAnalysis):
     def __init__(self, ys, samplerate=44100):
         """Predict pitch of a given audio chunk using YIN algorithm
@@ -73,11 +908,16 @@ class Autocorrelation(PitchAnalysis):
         super(Autocorrelation, self).__init__(ys, samplerate=samplerate)
 
     @staticmethod
-    def get_pitch_freq(ys, samplerate=44100):
+    def get_pitch_freq(ys, samplerate=44100, out=None):
+        """
+        Args:
+            out (np.array): Optional preallocated buffer of length 
+                            `Autocorrelation.lag_count(len(ys))`.
+        """
         analysis = Autocorrelation(ys, samplerate)
         corrs = analysis.autocorrelate(analysis.ys)
-        cmn = analysis.cumulative_mean_normalized(corrs)
-        freq = analysis.absolute_threshold(cmn)
+        cmn = analysis.cumulative_mean_normalized(corrs, out=out)
+        freq = analysis.absolute_threshold(cmn, samplerate=samplerate)
         pitch = freq2key(freq)
         return pitch, freq
 
@@ -103,43 +943,50 @@ class Autocorrelation(PitchAnalysis):
         corrs /= corrs[0]
         return corrs
 
-    def cumulative_mean_normalized(self, corrs):
+    @staticmethod
+    def lag_count(n):
+        return n - n // 2
+
+    @classmethod
+    def frame_freqs(cls, frames, samplerate=44100, threshold=0.1):
+        cmn = cls.cumulative_mean_normalized_frames(frames)
+        return threshold_freqs(cmn, samplerate=samplerate, threshold=threshold)
+
+    @staticmethod
+    def cumulative_mean_normalized_frames(frames):
+        frames = np.asarray(frames, dtype=np.float64)
+        N = frames.shape[-1]
+        num_lags = Autocorrelation.lag_count(N)
+
+        corrs = autocorrelation_fft(frames, num_lags)
+        # Same offset and normalization as `autocorrelate`
+        corrs /= np.arange(N, N - num_lags, -1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corrs /= corrs[..., :1]
+        corrs *= -1
+        corrs += 1
+        return cumulative_mean_normalized(corrs)
+
+    def cumulative_mean_normalized(self, corrs, out=None):
         """
         Args:
-            diffs (np.array): Difference over range of lags
+            corrs (np.array): Normalized autocorrelation over range of lags
+            out (np.array): Optional preallocated output buffer
         """
         corrs *= -1
         corrs += 1
-        cmn = np.zeros(corrs.shape)
-        cmn[0] = 1
-        for lag in range(1, len(corrs)) :
-            cmn[lag] = corrs[lag] / (
-            np.sum(corrs[1:lag+1]) / lag
-            )  
-        return cmn
+        return cumulative_mean_normalized(corrs, out=out)
 
     def absolute_threshold(self, cmn, samplerate=44100, threshold=0.1):
         """
         Args:
             cmn (np.array): Cumulative mean normalized difference
+            samplerate (int): Sample rate of the analysed chunk
 
         Return fundamental frequency of chunk
         """
-        def cannot_apply_absolute_threshold(cmn):
-            return np.alltrue(cmn > threshold)
-        
-        if cannot_apply_absolute_threshold(cmn):
-            # Return global minimum period
-            return  44100 / np.argmin(cmn)
-        
-        first_dip_start = np.argmax(cmn < threshold)
-        first_dip_end = np.argmax(cmn[first_dip_start:] > threshold) + first_dip_start
-
-        absolute_threshold_min = np.argmin(
-            cmn[first_dip_start:first_dip_end]
-        ) + first_dip_start
-
-        return 44100 / absolute_threshold_min
+        lags, _ = absolute_threshold_frames(cmn, threshold=threshold)
+        return samplerate / lags[0]
 
     
 
@@ -154,64 +1001,272 @@ class YIN(PitchAnalysis):
         Args:
             ys (np.array): Small audio chunk.
 
-        TODO: Parse entire audio segment. 
-              Now it supports only real-time use which takes only a single chunk.
+        Use `get_pitch_freqs` over `frame_signal` for multiple chunks, or
+        `track_pitch` to stream an entire audio segment.
         """
         super(YIN, self).__init__(ys, samplerate=samplerate)
 
         
 
     @staticmethod
-    def get_pitch_freq(ys, samplerate=44100):
+    def get_pitch_freq(ys, samplerate=44100, method='fft', out=None):
         """Return pitch and freq for a single chunk of audio for real-time use. 
+
+        Args:
+            method (str): Engine of the difference function. Either 'fft'
+                          (default) or 'reference'.
+            out (np.array): Optional preallocated buffer of length 
+                            `YIN.lag_count(len(ys))`.
         """
         analysis = YIN(ys, samplerate=samplerate)
-        diff = analysis.difference(analysis.ys)
-        cmn = analysis.cumulative_mean_normalized(diff)
+        diff = analysis.difference(analysis.ys, method=method)
+        cmn = analysis.cumulative_mean_normalized(diff, out=out)
         freq = analysis.absolute_threshold(cmn, samplerate=samplerate)
         pitch = freq2key(freq)
         return  pitch, freq
     
-    def difference(self, ys):
-        N = len(ys)    
-        return np.array(
-            [ np.sum(
-                ( ys[lag:] - ys[:N-lag] ) ** 2
-                ) for lag in range(N//2) ]
-            )
+    def difference(self, ys, method='fft'):
+        """
+        Args:
+            ys (np.array): Small audio chunk.
+            method (str): 'fft' for the O(N log N) engine or 'reference' for
+                          the direct O(N^2) summation.
+
+        Return difference over the range of lags [0, N/2)
+        """
+        if method == 'fft':
+            return difference_fft(ys)
+        elif method == 'reference':
+            return difference_reference(ys)
+        raise ValueError(f'Unknown difference method: {method}')
+
+    @classmethod
+    def frame_freqs(cls, frames, samplerate=44100, threshold=0.1):
+        cmn = cls.cumulative_mean_normalized_frames(frames)
+        return threshold_freqs(cmn, samplerate=samplerate, threshold=threshold)
+
+    @staticmethod
+    def cumulative_mean_normalized_frames(frames):
+        return cumulative_mean_normalized(difference_fft(frames))
 
     
-    def cumulative_mean_normalized(self, diffs):
+    def cumulative_mean_normalized(self, diffs, out=None):
         """
         Args:
             diffs (np.array): Difference over range of lags
+            out (np.array): Optional preallocated output buffer
         """
-        cmn = np.zeros(diffs.shape)
-        cmn[0] = 1
-        for lag in range(1, len(diffs)) :
-            cmn[lag] = diffs[lag] / (
-            np.sum(diffs[1:lag+1]) / lag
-            )  
-        return cmn
+        return cumulative_mean_normalized(diffs, out=out)
 
 
     def absolute_threshold(self, cmn, samplerate=44100, threshold=0.1):
         """
         Args:
             cmn (np.array): Cumulative mean normalized difference
+            samplerate (int): Sample rate of the analysed chunk
+
+        Return fundamental frequency of chunk
         """
-        def cannot_apply_absolute_threshold(cmn):
-            return np.alltrue(cmn > threshold)
-        
-        if cannot_apply_absolute_threshold(cmn):
-            # Return global minimum period
-            return  44100 / np.argmin(cmn)
-        
-        first_dip_start = np.argmax(cmn < threshold)
-        first_dip_end = np.argmax(cmn[first_dip_start:] > threshold) + first_dip_start
+        lags, _ = absolute_threshold_frames(cmn, threshold=threshold)
+        return samplerate / lags[0]
+
+
+@lru_cache(maxsize=8)
+def _hann(n):
+    """Read-only Hann window shared across calls."""
+    window = np.hanning(n)
+    window.flags.writeable = False
+    return window
+
+
+class HPS(PitchAnalysis):
+    # Number of harmonics scored per candidate fundamental
+    num_harmonics = 5
+    # Zero padding of the FFT, for finer frequency bins
+    padding = 2
+    # Lowest power of a fundamental relative to the strongest bin
+    min_fundamental = 0.001
+    # Lowest power of a fundamental relative to its local background
+    min_prominence = 10
+
+    def __init__(self, ys, samplerate=44100):
+        """Predict pitch of a given audio chunk with the harmonic product 
+        spectrum.
+
+        The power spectrum is downsampled by 2, 3, ... num_harmonics and 
+        multiplied with itself (summed, in logs), so the harmonics of the 
+        fundamental line up in one peak. The log power is taken relative to
+        its local background and the sum is averaged over the harmonics 
+        below Nyquist, so high notes with weak upper partials still win 
+        over low-frequency noise. Downsampling is strided slicing of
+        one rfft, which keeps it O(N log N). Unlike YIN, it needs only a 
+        few periods per chunk, which suits short chunks of high notes.
+
+        Args:
+            ys (np.array): Small audio chunk.
+        """
+        super(HPS, self).__init__(ys, samplerate=samplerate)
+
+    @staticmethod
+    def get_pitch_freq(ys, samplerate=44100, out=None):
+        """Return pitch and freq for a single chunk of audio for real-time use.
+
+        Args:
+            out (np.array): Accepted like the buffer of the other detectors
+                            and unused, since HPS has no lag domain
+        """
+        analysis = HPS(ys, samplerate=samplerate)
+        freqs, _ = HPS.frame_freqs(analysis.ys[np.newaxis], samplerate=samplerate)
+        return freq2key(freqs[0]), freqs[0]
+
+    @classmethod
+    def frame_freqs(cls, frames, samplerate=44100, threshold=0.1):
+        """Return freqs and confidences of a block of frames. The confidence
+        is the share of the power in the harmonics of the fundamental, and 
+        frames below threshold have a NaN freq.
+
+        Args:
+            frames (np.array): (frames x samples) array
+        """
+        frames = np.atleast_2d(np.asarray(frames, dtype=np.float64))
+        n = frames.shape[-1]
+        n_fft = cls.padding << (n - 1).bit_length()
+        power = np.abs(np.fft.rfft(frames * _hann(n), n=n_fft, axis=-1)) ** 2
+        log_power = np.log(power + np.finfo(np.float64).tiny)
+        num_bins = power.shape[-1]
+
+        # Whiten the spectrum: a partial scores by how far it stands out of
+        # its neighbourhood, so low-frequency rumble doesn't outweigh the
+        # weak upper partials of high notes. Bins below the background 
+        # count as absent instead of vetoing the candidate.
+        background = scipy.ndimage.uniform_filter1d(
+            log_power, 64 * cls.padding + 1, axis=-1, mode='nearest')
+        prominence = np.maximum(log_power - background, 0)
+        # Harmonics of a peak bin are up to num_harmonics / 2 bins off, and
+        # strings are slightly inharmonic, so take the best bin nearby
+        prominence = scipy.ndimage.maximum_filter1d(
+            prominence, 2 * cls.padding + 1, axis=-1, mode='nearest')
+
+        # Only harmonics below Nyquist count, so the score is their mean
+        lowest = int(np.ceil(SORTED_FREQUENCY_ARRAY[0] * n_fft / samplerate))
+        highest = min(num_bins, int(SORTED_FREQUENCY_ARRAY[-1] * n_fft / samplerate) + 1)
+        hps = np.zeros((len(frames), highest))
+        counts = np.zeros(highest)
+        for harmonic in range(1, cls.num_harmonics + 1):
+            m = min(highest, -(-num_bins // harmonic))
+            hps[:, :m] += prominence[:, :m * harmonic:harmonic]
+            counts[:m] += 1
+        hps /= counts
+
+        # A fundamental must be a spectral peak that stands out of both the
+        # whole spectrum and its background
+        peaks = log_power == scipy.ndimage.maximum_filter1d(
+            log_power, 2 * cls.padding + 1, axis=-1, mode='nearest')
+        peaks &= log_power >= np.log(cls.min_fundamental) + log_power.max(axis=-1, keepdims=True)
+        peaks &= log_power - background >= np.log(cls.min_prominence)
+        hps[~peaks[:, :highest]] = -np.inf
+        hps[:, :lowest] = -np.inf
+
+        rows = np.arange(len(frames))
+        bins = np.argmax(hps, axis=-1)
+        found = np.isfinite(hps[rows, bins])
+
+        # Hann leakage spreads a partial over about twice padding bins 
+        # either side. Mark every bin of the harmonics once, since the 
+        # leakage of close harmonics overlaps.
+        spread = 2 * cls.padding
+        harmonics = bins[:, np.newaxis] * np.arange(1, cls.num_harmonics + 1)
+        harmonic_bins = harmonics[:, :, np.newaxis] + np.arange(-spread, spread + 1)
+        harmonic_bins = harmonic_bins.reshape(len(frames), -1)
+        inside = (harmonic_bins >= 0) & (harmonic_bins < num_bins)
+        in_harmonics = np.zeros(power.shape, dtype=bool)
+        in_harmonics[np.nonzero(inside)[0], harmonic_bins[inside]] = True
+        with np.errstate(invalid='ignore', divide='ignore'):
+            confidences = np.where(in_harmonics, power, 0).sum(axis=-1)
+            confidences /= power.sum(axis=-1)
+            confidences = np.nan_to_num(confidences)
+
+        # The log power of a Hann windowed partial is close to a parabola
+        freqs = parabolic_interpolation(log_power, bins) * samplerate / n_fft
+        freqs[(confidences < threshold) | ~found] = np.nan
+        return freqs, confidences
+
+
+PitchTrackPoint = namedtuple('PitchTrackPoint', ['time', 'freq', 'pitch', 'confidence'])
+
+
+def _iter_blocks(source, block_length, channel=None):
+    """Return framerate, start time and an iterator of sample blocks of a
+    `thinkdsp.Wave` or a WAV file path. Blocks are 1-D or 
+    (frames x channels), or 1-D of only the given channel.
+    """
+    if hasattr(source, 'ys'):
+        ys = source.ys
+        if channel is not None and ys.ndim == 2:
+            ys = ys[:, channel]
+        blocks = (ys[i:i+block_length] for i in range(0, len(ys), block_length))
+        return source.framerate, source.start, blocks
+
+    wav = WavMap(source)
+    blocks = (block for _, block in wav_blocks(wav, block_length, channel=channel))
+    return wav.framerate, 0, blocks
+
+
+def track_pitch(source, detection_method=None, frame_length=11025, 
+                hop_length=None, threshold=0.1, frames_per_block=64,
+                all_channels=False):
+    """Stream a time-stamped pitch track over an entire audio segment. 
+
+    The source is read frames_per_block frames at a time and only the
+    samples that overlap into the next block are kept, so memory is 
+    bounded regardless of the length of the recording.
+
+    Args:
+        source (thinkdsp.Wave, str or Path): Wave or path of a WAV file
+        detection_method (PitchAnalysis): Default is YIN
+        frame_length (int): Number of samples per analysed frame
+        hop_length (int): Number of samples between frame starts. 
+                          Default is half of frame_length.
+        frames_per_block (int): Number of frames analysed in one vectorized 
+                                pass
+        all_channels (bool): Track every channel of a multi-channel source
+                             instead of only the first one
+
+    Yields PitchTrackPoint(time, freq, pitch, confidence) per frame, where
+    time is the midpoint of the frame in seconds. With all_channels, freq,
+    pitch and confidence are arrays with one track per channel.
+    """
+    detection_method = YIN if detection_method is None else detection_method
+    hop_length = frame_length // 2 if hop_length is None else hop_length
+    block_length = hop_length * frames_per_block
+
+    framerate, start, blocks = _iter_blocks(
+        source, block_length, channel=None if all_channels else 0)
+    # Channels x samples not analysed yet
+    pending = None
+    # Index of the first sample in pending
+    offset = 0
+
+    for block in blocks:
+        # Make every block (channels x samples)
+        block = np.reshape(block, (len(block), -1)).T
+        pending = block if pending is None else np.concatenate((pending, block), axis=-1)
+
+        frames = frame_signal(pending, frame_length, hop_length)
+        num_frames = frames.shape[-2]
+        if num_frames == 0:
+            continue
+
+        pitches, freqs, confidences = detection_method.get_pitch_freqs(
+            frames, samplerate=framerate, threshold=threshold, 
+            block_size=frames_per_block)
 
-        absolute_threshold_min = np.argmin(
-            cmn[first_dip_start:first_dip_end]
-        ) + first_dip_start
+        for i in range(num_frames):
+            time = start + (offset + i * hop_length + frame_length / 2) / framerate
+            # Every channel, or the scalar results of the only one
+            index = (slice(None), i) if all_channels else (0, i)
+            yield PitchTrackPoint(time, freqs[index], pitches[index], confidences[index])
 
-        return 44100 / absolute_threshold_min
\ No newline at end of file
+        consumed = num_frames * hop_length
+        pending = pending[..., consumed:]
+        offset += consumed
@@ -0,0 +1,332 @@
+"""Tests for the audio signal processing module of pitch_perfect.
+"""
+
+import unittest
+
+import numpy as np
+
+from pitch_perfect.config import PATHS
+from pitch_perfect.thinkdsp import asp, wavio
+
+
+def make_sine(freq, n=11025, samplerate=44100):
+    ts = np.arange(n) / samplerate
+    return np.sin(2 * np.pi * freq * ts)
+
+
+class Test(unittest.TestCase):
+
+    def testDifferenceFftMatchesReference(self):
+        np.random.seed(17)
+        ys = np.random.randn(1001)
+        fast = asp.difference_fft(ys)
+        slow = asp.difference_reference(ys)
+
+        self.assertEqual(fast.shape, slow.shape)
+        self.assertTrue(np.allclose(fast, slow, atol=1e-8))
+
+    def testYinMethods(self):
+        ys = make_sine(440)
+        fast = asp.YIN.get_pitch_freq(ys, method='fft')
+        slow = asp.YIN.get_pitch_freq(ys, method='reference')
+
+        self.assertEqual(fast[0], slow[0])
+        self.assertAlmostEqual(fast[1], slow[1], places=6)
+
+    def testSampleRates(self):
+        for samplerate in (44100, 16000, 8000):
+            ys = make_sine(440, n=samplerate // 4, samplerate=samplerate)
+            for detector in (asp.YIN, asp.Autocorrelation, asp.HPS):
+                pitch, freq = detector.get_pitch_freq(ys, samplerate=samplerate)
+                self.assertEqual(pitch, 'a3')
+                self.assertAlmostEqual(freq, 440, delta=1)
+
+    def testHPS(self):
+        ys = sum(0.6 ** harmonic * make_sine((harmonic + 1) * 1046.5, n=1024)
+                 for harmonic in range(5))
+        pitch, freq = asp.HPS.get_pitch_freq(ys)
+        self.assertEqual(pitch, 'c5')
+        self.assertAlmostEqual(freq, 1046.5, delta=1)
+
+        pitch, freq = asp.HPS.get_pitch_freq(np.zeros(1024))
+        self.assertIsNone(pitch)
+        self.assertTrue(np.isnan(freq))
+
+    def testHPSHighNotes(self):
+        # Low-frequency rumble used to outweigh the weak upper partials.
+        # The first 0.3 s hold the thump of the hammer.
+        for note, frame_length in (('c6', 1024), ('c6', 11025), ('d6', 2048)):
+            track = [point for point in asp.track_pitch(
+                         PATHS.data / 'piano' / f'{note}.wav', asp.HPS,
+                         frame_length=frame_length)
+                     if 0.3 < point.time < 1 and point.pitch is not None]
+            pitches = [point.pitch for point in track]
+            self.assertGreaterEqual(pitches.count(note), 0.9 * len(pitches))
+            self.assertGreater(min(point.freq for point in track), 1000)
+
+    def testHPSConfidence(self):
+        # Short frames of high notes put the harmonics a few bins apart
+        for note in ('c7', 'd7'):
+            track = asp.track_pitch(PATHS.data / 'piano' / f'{note}.wav', asp.HPS,
+                                    frame_length=1024)
+            confidences = [point.confidence for point in track]
+            self.assertLessEqual(max(confidences), 1)
+
+    def testParabolicInterpolation(self):
+        xs = np.arange(10.0)
+        ys = (xs - 4.3) ** 2
+        refined = asp.parabolic_interpolation(ys, np.array([4]))
+        self.assertAlmostEqual(refined[0], 4.3)
+
+    def testAbsoluteThresholdBelowNyquist(self):
+        # The hammer of c6 gives chunks whose cmn is lowest at lag 1
+        with wavio.WavMap(PATHS.data / 'piano' / 'c6.wav') as wav:
+            ys = wav.read(channel=0)
+        frames = asp.frame_signal(ys, 2048, 1024)
+        for detector in (asp.YIN, asp.Autocorrelation):
+            _, freq = detector.get_pitch_freq(ys[2048:4096], samplerate=44100)
+            self.assertLessEqual(freq, 22050)
+            cmn = detector.cumulative_mean_normalized_frames(frames)
+            for interpolate in (True, False):
+                lags, _ = asp.absolute_threshold_frames(cmn, interpolate=interpolate)
+                self.assertLessEqual(np.max(44100 / lags), 22050)
+
+    def testCumulativeMeanNormalized(self):
+        np.random.seed(17)
+        diffs = asp.difference_fft(np.random.randn(501))
+        expected = np.ones(diffs.shape)
+        for lag in range(1, len(diffs)):
+            expected[lag] = diffs[lag] / (np.sum(diffs[1:lag+1]) / lag)
+
+        out = np.empty(diffs.shape)
+        cmn = asp.cumulative_mean_normalized(diffs, out=out)
+
+        self.assertIs(cmn, out)
+        self.assertTrue(np.allclose(cmn, expected))
+
+    def testCumulativeMeanNormalizedSilence(self):
+        cmn = asp.cumulative_mean_normalized(np.zeros(64))
+        self.assertTrue(np.all(cmn == 1))
+
+    def testThresholdFreqsWithoutDip(self):
+        cmn = np.stack([asp.cumulative_mean_normalized(np.zeros(128)),
+                        asp.YIN.cumulative_mean_normalized_frames(make_sine(440, n=256))])
+        freqs, _ = asp.threshold_freqs(cmn, samplerate=44100)
+        self.assertTrue(np.isnan(freqs[0]))
+        self.assertAlmostEqual(freqs[1], 440, delta=2)
+
+        # Silence in a track has no pitch rather than the sample rate
+        ys = np.concatenate([np.zeros(4096), make_sine(440, n=4096)])
+        for detector in (asp.YIN, asp.Autocorrelation):
+            pitches, freqs, _ = detector.get_pitch_freqs(
+                asp.frame_signal(ys, 2048, 2048))
+            self.assertTrue(np.all(np.isnan(freqs[:2])))
+            self.assertEqual(list(pitches[:2]), [None, None])
+            self.assertEqual(list(pitches[2:]), ['a3', 'a3'])
+
+    def testLagCount(self):
+        ys = make_sine(440, n=4001)
+        for detector in (asp.YIN, asp.Autocorrelation, asp.HPS):
+            out = np.empty(detector.lag_count(len(ys)))
+            pitch, freq = detector.get_pitch_freq(ys, out=out)
+            self.assertEqual(pitch, 'a3')
+
+    def testBatchMatchesSingleChunk(self):
+        ys = np.concatenate([make_sine(freq, n=4410) for freq in (220, 440, 523)])
+        frames = asp.frame_signal(ys, 4410)
+        self.assertEqual(frames.shape, (3, 4410))
+
+        for detector in (asp.YIN, asp.Autocorrelation, asp.HPS):
+            pitches, freqs, confidences = detector.get_pitch_freqs(
+                frames, block_size=2)
+            for frame, pitch, freq in zip(frames, pitches, freqs):
+                expected_pitch, expected_freq = detector.get_pitch_freq(frame)
+                self.assertEqual(pitch, expected_pitch)
+                self.assertAlmostEqual(freq, expected_freq)
+            self.assertTrue(np.all(confidences > 0.9))
+
+    def testMultiChannelBatch(self):
+        ys = np.stack([make_sine(freq, n=8820) for freq in (220, 440, 523)])
+        frames = asp.frame_signal(ys, 4410)
+        self.assertEqual(frames.shape, (3, 2, 4410))
+
+        pitches, freqs, confidences = asp.YIN.get_pitch_freqs(frames)
+        self.assertEqual(freqs.shape, (3, 2))
+        self.assertEqual(pitches[:, 0].tolist(), ['a2', 'a3', 'c4'])
+        self.assertEqual(pitches[:, 1].tolist(), ['a2', 'a3', 'c4'])
+
+    def testMultiChannelDecimator(self):
+        ys = np.stack([make_sine(220, n=44100), make_sine(440, n=44100)], axis=1)
+        decimator = asp.Decimator(44100, target_samplerate=11025)
+        decimated = np.concatenate([decimator.decimate(chunk) for chunk in np.split(ys, 4)])
+
+        self.assertEqual(decimated.shape, (11025, 2))
+        self.assertTrue(np.allclose(
+            decimated[:, 1], asp.Decimator(44100, 11025).decimate(ys[:, 1])))
+
+    def testOverlapAdd(self):
+        np.random.seed(17)
+        ys = np.random.randn(1000)
+        window = np.hanning(100)
+        frames = asp.frame_signal(ys, 100, 30) * window
+
+        ola = asp.OverlapAdd(100, 30, window)
+        rebuilt = np.concatenate(
+            [ola.add(block) for block in np.array_split(frames, 4)] + [ola.flush()])
+
+        # Hann windows are zero at both ends, so the first and last
+        # samples can't be recovered
+        self.assertEqual(len(rebuilt), 1000)
+        self.assertTrue(np.allclose(rebuilt[1:-1], ys[1:-1]))
+        self.assertEqual(rebuilt[0], 0)
+
+    def testConstantQ(self):
+        cq = asp.ConstantQ(44100, hop_length=4096)
+        self.assertEqual(cq.frame_length, 32768)
+
+        ys = 0.5 * make_sine(440, n=88200) + 0.5 * make_sine(32.703, n=88200)
+        coefficients = cq.batch(ys)
+        self.assertEqual(coefficients.shape, (len(cq.keys), 14))
+
+        amps = np.abs(coefficients[:, 5])
+        self.assertEqual(sorted(cq.keys[np.argsort(amps)[-2:]]), ['a3', 'c0'])
+        self.assertAlmostEqual(amps[list(cq.keys).index('a3')], 0.5, places=3)
+
+        streamed = np.concatenate(
+            [cq.update(chunk) for chunk in np.array_split(ys, 50)], axis=1)
+        self.assertTrue(np.allclose(streamed, coefficients))
+
+    def testMultiPitch(self):
+        freqs = {'a2': 220.0, 'c#3': 277.183, 'e3': 329.628, 'f#4': 739.989}
+        ys = sum(0.2 * 0.6 ** harmonic * make_sine((harmonic + 1) * freq, n=66150)
+                 for freq in freqs.values() for harmonic in range(5))
+
+        multi_pitch = asp.MultiPitch(44100, hop_length=4096)
+        frames = multi_pitch.batch(ys)
+        self.assertEqual(len(frames), 9)
+        self.assertTrue(all(notes == set(freqs) for notes in frames))
+
+        streamed = [notes for chunk in np.array_split(ys, 20) 
+                    for notes in multi_pitch.update(chunk)]
+        self.assertEqual(streamed, frames)
+        self.assertEqual(multi_pitch.batch(np.zeros(44100)), [set()] * 3)
+
+    def testRingBuffer(self):
+        np.random.seed(17)
+        ring = asp.RingBuffer(100)
+        expected = np.zeros(100)
+        for n in (30, 60, 99, 1, 250, 7):
+            ys = np.random.randn(n)
+            ring.extend(ys)
+            expected = np.concatenate((expected, ys))[-100:]
+
+            self.assertTrue(np.allclose(ring.values(), expected))
+            self.assertAlmostEqual(ring.sum_of_squares, np.sum(expected ** 2))
+        self.assertAlmostEqual(
+            ring.get_sound_pressure_level(), asp.get_sound_pressure_level(expected))
+
+    def testSPLMeter(self):
+        np.random.seed(17)
+        ys = 0.1 * np.random.randn(4000)
+        meter = asp.SPLMeter(samplerate=1000, windows=(0.05, 1.0))
+        for chunk in np.split(ys, 40):
+            levels = meter.update(chunk)
+
+        self.assertAlmostEqual(levels[0], asp.get_sound_pressure_level(ys[-50:]))
+        self.assertAlmostEqual(levels[1], asp.get_sound_pressure_level(ys[-1000:]))
+
+        meter = asp.SPLMeter(samplerate=1000, windows=('fast', 'slow'), mode='exponential')
+        for chunk in np.split(ys, 40):
+            levels = meter.update(chunk)
+        for level, tau in zip(levels, (0.125, 1.0)):
+            alpha = 1 - np.exp(-1 / (tau * 1000))
+            mean_square = 0
+            for y in ys:
+                mean_square += alpha * (y ** 2 - mean_square)
+            self.assertAlmostEqual(level, asp.mean_square_to_spl(mean_square))
+
+    def testSPLSilence(self):
+        meter = asp.SPLMeter(samplerate=1000)
+        levels = meter.update(np.zeros(100))
+
+        self.assertTrue(np.all(levels == -np.inf))
+        self.assertEqual(asp.get_sound_pressure_level(np.zeros(10)), -np.inf)
+        self.assertTrue(asp.is_quiet(levels[0]))
+
+    def testFreq2Key(self):
+        self.assertEqual(asp.freq2key(440), 'a3')
+        self.assertEqual(asp.freq2key(32.703), 'c0')
+        self.assertIsNone(asp.freq2key(np.nan))
+        self.assertIsNone(asp.freq2key(20))
+        self.assertIsNone(asp.freq2key(44100))
+
+    def testFreqs2Notes(self):
+        keys, midi, cents = asp.freqs2notes([440, 466.164 * 2 ** (-10 / 1200), np.nan])
+
+        self.assertEqual(list(keys), ['a3', 'a#3', None])
+        self.assertEqual(list(midi[:2]), [69, 70])
+        self.assertAlmostEqual(cents[0], 0)
+        self.assertAlmostEqual(cents[1], -10)
+        self.assertTrue(np.isnan(midi[2]) and np.isnan(cents[2]))
+
+    def testDecimator(self):
+        ys = make_sine(440, n=44100) + make_sine(9000, n=44100)
+        decimator = asp.Decimator(44100, target_samplerate=11025)
+        chunks = [decimator.decimate(chunk) for chunk in np.split(ys, 4)]
+        decimated = np.concatenate(chunks)
+
+        self.assertEqual(decimator.factor, 4)
+        self.assertEqual(len(decimated), 11025)
+        self.assertTrue(np.allclose(
+            decimated, asp.Decimator(44100, 11025).decimate(ys)))
+
+        # 9 kHz is above the new Nyquist frequency and must not alias
+        amps = np.abs(np.fft.rfft(decimated[1000:]))
+        fs = np.fft.rfftfreq(len(decimated) - 1000, 1 / decimator.samplerate)
+        self.assertAlmostEqual(fs[np.argmax(amps)], 440, delta=2)
+        pitch, freq = asp.YIN.get_pitch_freq(
+            decimated[:2756], samplerate=decimator.samplerate)
+        self.assertEqual(pitch, 'a3')
+
+    def testTrackPitch(self):
+        track = list(asp.track_pitch(
+            PATHS.data / 'a4.wav', frame_length=4410, frames_per_block=3))
+        times = [point.time for point in track]
+
+        self.assertEqual(len(track), 43)
+        self.assertAlmostEqual(times[0], 0.05)
+        self.assertTrue(np.allclose(np.diff(times), 0.05))
+        self.assertTrue(all(point.pitch == 'a3' for point in track))
+
+    def testTrackPitchAllChannels(self):
+        track = list(asp.track_pitch(
+            PATHS.data / 'a4.wav', frame_length=4410, all_channels=True))
+
+        # a4.wav is a stereo recording
+        self.assertEqual(track[0].freq.shape, (2,))
+        self.assertTrue(all(list(point.pitch) == ['a3', 'a3'] for point in track))
+
+    def testDetectorsImplementFrameFreqs(self):
+        class Detector(asp.PitchAnalysis):
+            pass
+
+        # frame_freqs is the one method a detector must implement
+        self.assertRaises(TypeError, Detector, make_sine(440))
+        for detector in (asp.Autocorrelation, asp.YIN, asp.HPS):
+            freqs, _ = detector.frame_freqs(make_sine(440, n=4410)[np.newaxis])
+            self.assertAlmostEqual(freqs[0], 440, delta=2)
+
+    def testMultiChannelChunk(self):
+        with wavio.WavMap(PATHS.data / 'a4.wav') as wav:
+            ys = wav.read(0, wav.framerate // 4)
+            samplerate = wav.framerate
+
+        # A (frames x channels) chunk must not be interleaved into one signal
+        self.assertRaises(ValueError, asp.YIN.get_pitch_freq, ys, samplerate)
+        self.assertEqual(asp.YIN.get_pitch_freq(ys[:, :1], samplerate)[0], 'a3')
+        pitches, _, _ = asp.YIN.get_pitch_freqs(ys.T, samplerate)
+        self.assertEqual(list(pitches), ['a3', 'a3'])
+
+
+if __name__ == "__main__":
+    unittest.main()
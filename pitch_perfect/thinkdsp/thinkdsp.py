@@ -18,7 +18,9 @@ import scipy.stats
 import scipy.fftpack
 import struct
 import subprocess
+from . import asp
 from . import thinkplot
+from . import wavio
 import warnings
 
 from fractions import gcd
@@ -51,34 +53,33 @@ class UnimplementedMethodException(Exception):
 class WavFileWriter:
     """Writes wav files."""
 
-    def __init__(self, filename='sound.wav', framerate=11025):
+    def __init__(self, filename='sound.wav', framerate=11025, nchannels=1,
+                 sample_format='int16', append=False):
         """Opens the file and sets parameters.
 
         filename: string
         framerate: samples per second
+        nchannels: number of channels
+        sample_format: 'int16', 'int24', 'int32' or 'float32'
+        append: whether to continue an existing file
         """
         self.filename = filename
         self.framerate = framerate
-        self.nchannels = 1
-        self.sampwidth = 2
-        self.bits = self.sampwidth * 8
-        self.bound = 2**(self.bits-1) - 1
-
-        self.fmt = 'h'
-        self.dtype = np.int16
-
-        self.fp = open_wave(self.filename, 'w')
-        self.fp.setnchannels(self.nchannels)
-        self.fp.setsampwidth(self.sampwidth)
-        self.fp.setframerate(self.framerate)
+        self.nchannels = nchannels
+        self.sample_format = sample_format
+        self.writer = wavio.WavWriter(filename, framerate, nchannels=nchannels,
+                                      sample_format=sample_format, append=append)
     
     def write(self, wave):
         """Writes a wave.
 
-        wave: Wave
+        wave: Wave, or array of samples in [-1, 1]
         """
-        zs = wave.quantize(self.bound, self.dtype)
-        self.fp.writeframes(zs.tostring())
+        ys = np.asarray(getattr(wave, 'ys', wave))
+        if ys.dtype.kind == 'f' and (np.max(ys) > 1 or np.min(ys) < -1):
+            warnings.warn('Warning: normalizing before quantizing.')
+            ys = normalize(ys)
+        self.writer.write(ys)
 
     def close(self, duration=0):
         """Closes the file.
@@ -86,50 +87,46 @@ class WavFileWriter:
         duration: how many seconds of silence to append
         """
         if duration:
-            self.write(rest(duration))
+            self.writer.write(np.zeros((int(duration * self.framerate), self.nchannels)))
 
-        self.fp.close()
+        self.writer.close()
 
 
-def read_wave(filename='sound.wav'):
+def read_wave(filename='sound.wav', mono=True):
     """Reads a wave file.
 
     filename: string
+    mono: boolean, whether to keep only the first channel; otherwise
+          a multi-channel file gives a Wave with (frames x channels) ys
 
     returns: Wave
     """
-    if type(filename) is not str:
-        filename = str(filename)
+    with wavio.WavMap(filename) as wav:
+        ys = wav.read(channel=0 if mono or wav.nchannels == 1 else None)
+        framerate = wav.framerate
 
-    fp = open_wave(filename, 'r')
+    wave = Wave(ys, framerate=framerate)
+    wave.normalize()
+    return wave
 
-    nchannels = fp.getnchannels()
-    nframes = fp.getnframes()
-    sampwidth = fp.getsampwidth()
-    framerate = fp.getframerate()
-    
-    z_str = fp.readframes(nframes)
-    
-    fp.close()
 
-    dtype_map = {1:np.int8, 2:np.int16, 3:'special', 4:np.int32}
-    if sampwidth not in dtype_map:
-        raise ValueError('sampwidth %d unknown' % sampwidth)
-    
-    if sampwidth == 3:
-        xs = np.fromstring(z_str, dtype=np.int8).astype(np.int32)
-        ys = (xs[2::3] * 256 + xs[1::3]) * 256 + xs[0::3]
-    else:
-        ys = np.fromstring(z_str, dtype=dtype_map[sampwidth])
+def read_wave_blocks(filename, block_length, overlap=0, mono=True):
+    """Reads a wave file one block at a time, with constant memory.
 
-    # if it's in stereo, just pull out the first channel
-    if nchannels == 2:
-        ys = ys[::2]
+    Unlike read_wave, blocks are not normalized; samples are in [-1, 1).
 
-    #ts = np.arange(len(ys)) / framerate
-    wave = Wave(ys, framerate=framerate)
-    wave.normalize()
-    return wave
+    filename: string
+    block_length: int, number of frames per block; the last block
+                  may be shorter
+    overlap: int, number of frames a block shares with the previous one
+    mono: boolean, whether to keep only the first channel
+
+    yields: Wave, with start set to the time of its first frame
+    """
+    wav = wavio.WavMap(filename)
+    channel = 0 if mono or wav.nchannels == 1 else None
+    for start, ys in wavio.wav_blocks(wav, block_length, overlap, channel):
+        yield Wave(ys, framerate=wav.framerate, start=start / wav.framerate)
 
 
 def play_wave(filename='sound.wav', player='aplay'):
@@ -189,7 +186,10 @@ class _SpectrumParent:
 
         Returns: new Spectrum
         """
-        return copy.deepcopy(self)
+        new = copy.copy(self)
+        new.hs = self.hs.copy()
+        new.fs = self.fs.copy()
+        return new
 
     def max_diff(self, other):
         """Computes the maximum absolute difference between spectra.
@@ -525,48 +525,87 @@ class Dct(_SpectrumParent):
 
 
 class Spectrogram:
-    """Represents the spectrum of a signal."""
+    """Represents the spectrum of a signal over time.
+
+    The spectra are stored as the columns of one (freq x time) complex
+    array; spec_map offers the older map from time to Spectrum.
+    """
 
-    def __init__(self, spec_map, seg_length):
+    def __init__(self, hs, seg_length, ts=None, fs=None, framerate=None,
+                 hop_length=None, window=None):
         """Initialize the spectrogram.
 
-        spec_map: map from float time to Spectrum
+        hs: (freq x time) complex array, or a map from float time to 
+            Spectrum of a Hamming windowed segment
         seg_length: number of samples in each segment
-        """
-        self.spec_map = spec_map
+        ts: array of segment midpoints in seconds
+        fs: array of frequencies in Hz
+        framerate: samples per second of the wave
+        hop_length: number of samples between segments
+        window: array each segment was multiplied by, or None
+        """
+        if isinstance(hs, dict):
+            ts = np.array(sorted(hs))
+            spectrum = hs[ts[0]]
+            fs, framerate = spectrum.fs, spectrum.framerate
+            hs = np.stack([hs[t].hs for t in ts], axis=1)
+            if window is None:
+                # maps have always held Hamming windowed segments
+                window = np.hamming(seg_length)
+
+        self.hs = np.asanyarray(hs)
         self.seg_length = seg_length
+        self.ts = np.asanyarray(ts)
+        self.fs = np.asanyarray(fs)
+        self.framerate = framerate
+        self.hop_length = seg_length // 2 if hop_length is None else hop_length
+        self.window = window
+
+    def __len__(self):
+        """Number of segments."""
+        return len(self.ts)
+
+    @property
+    def amps(self):
+        """(freq x time) array of amplitudes (read-only property)."""
+        return np.absolute(self.hs)
+
+    def spectrum(self, j):
+        """Spectrum of segment j; its hs is a view of this spectrogram."""
+        return Spectrum(self.hs[:, j], self.fs, self.framerate)
+
+    @property
+    def spec_map(self):
+        """Map from float time to Spectrum (read-only property)."""
+        return {t: self.spectrum(j) for j, t in enumerate(self.ts)}
 
     def any_spectrum(self):
         """Returns an arbitrary spectrum from the spectrogram."""
-        index = next(iter(self.spec_map))
-        return self.spec_map[index]
+        return self.spectrum(0)
 
     @property
     def time_res(self):
         """Time resolution in seconds."""
-        spectrum = self.any_spectrum()
-        return float(self.seg_length) / spectrum.framerate
+        return float(self.seg_length) / self.framerate
 
     @property
     def freq_res(self):
         """Frequency resolution in Hz."""
-        return self.any_spectrum().freq_res
+        return self.framerate / 2 / (len(self.fs) - 1)
 
     def times(self):
         """Sorted sequence of times.
 
         returns: sequence of float times in seconds
         """
-        ts = sorted(iter(self.spec_map))
-        return ts
+        return self.ts
 
     def frequencies(self):
         """Sequence of frequencies.
 
         returns: sequence of float freqencies in Hz.
         """
-        fs = self.any_spectrum().fs
-        return fs
+        return self.fs
 
     def plot(self, high=None, **options):
         """Make a pseudocolor plot.
@@ -575,86 +614,138 @@ class Spectrogram:
         """
         fs = self.frequencies()
         i = None if high is None else find_index(high, fs)
-        fs = fs[:i]
-        ts = self.times()
-
-        # make the array
-        size = len(fs), len(ts)
-        array = np.zeros(size, dtype=np.float)
-
-        # copy amplitude from each spectrum into a column of the array
-        for j, t in enumerate(ts):
-            spectrum = self.spec_map[t]
-            array[:, j] = spectrum.amps[:i]
-
-        thinkplot.pcolor(ts, fs, array, **options)
+        thinkplot.pcolor(self.ts, fs[:i], np.absolute(self.hs[:i]), **options)
 
     def make_wave(self):
         """Inverts the spectrogram and returns a Wave.
 
+        Uses weighted overlap-add, so an unmodified spectrogram gives
+        back the samples it was made from.
+
         returns: Wave
         """
-        res = []
-        for t, spectrum in sorted(self.spec_map.items()):
-            wave = spectrum.make_wave()
-            n = len(wave)
-            
-            window = 1 / np.hamming(n)
-            wave.window(window)
+        ys = np.concatenate([wave.ys for wave in self.iter_waves(len(self))])
+        return Wave(ys, framerate=self.framerate, start=self.start)
 
-            i = wave.find_index(t)
-            start = i - n // 2
-            end = start + n
-            res.append((start, end, wave))
+    @property
+    def start(self):
+        """Time of the first sample of the first segment."""
+        return self.ts[0] - (self.seg_length - 1) / 2 / self.framerate
 
-        starts, ends, waves = zip(*res)
-        low = min(starts)
-        high = max(ends)
+    def iter_waves(self, frames_per_block=64):
+        """Inverts the spectrogram a block of segments at a time.
 
-        ys = np.zeros(high-low, np.float)
-        for start, end, wave in res:
-            ys[start:end] = wave.ys
+        frames_per_block: number of segments inverted per block
 
-        # ts = np.arange(len(ys)) / self.framerate
-        return Wave(ys, framerate=wave.framerate)
+        yields: Wave, consecutive pieces of the output of make_wave
+        """
+        ola = asp.OverlapAdd(self.seg_length, self.hop_length, self.window)
+        start = self.start
+        for j in range(0, len(self), frames_per_block):
+            hs = self.hs[:, j:j+frames_per_block]
+            frames = np.fft.irfft(hs, n=self.seg_length, axis=0).T
+            ys = ola.add(frames)
+            yield Wave(ys, framerate=self.framerate, start=start)
+            start += len(ys) / self.framerate
+
+        yield Wave(ola.flush(), framerate=self.framerate, start=start)
 
 
 class Wave:
     """Represents a discrete-time waveform.
 
+    A multi-channel wave has (frames x channels) ys.
     """
-    def __init__(self, ys, ts=None, framerate=None):
+    def __init__(self, ys, ts=None, framerate=None, start=0):
         """Initializes the wave.
 
-        ys: wave array
-        ts: array of times
+        ys: wave array, 1-D or (frames x channels)
+        ts: array of times, only needed if the wave is not uniformly
+            sampled; otherwise times are computed from start and framerate
         framerate: samples per second
+        start: float time of the first sample, used if ts is None
         """
         self.ys = np.asanyarray(ys)
         self.framerate = framerate if framerate is not None else 11025
+        self._start = start
+        self._ts = None if ts is None else np.asanyarray(ts)
 
-        if ts is None:
-            self.ts = np.arange(len(ys)) / self.framerate
-        else:
-            self.ts = np.asanyarray(ts)
+    @property
+    def ts(self):
+        """Array of times (property).
+
+        Computed on demand unless the wave has explicit times.
+        """
+        if self._ts is None:
+            return self._start + np.arange(len(self.ys)) / self.framerate
+        return self._ts
+
+    @ts.setter
+    def ts(self, ts):
+        self._ts = np.asanyarray(ts)
+
+    def _times(self, i=0, j=None, copy_ts=True):
+        """Keyword arguments that give a new Wave the times of ts[i:j].
+
+        copy_ts: boolean, whether explicit times are copied or shared
+
+        returns: dict with either ts or start
+        """
+        if self._ts is not None:
+            ts = self._ts[i:j]
+            return dict(ts=ts.copy() if copy_ts else ts)
+        first = range(len(self.ys))[i:j].start
+        return dict(start=self._start + first / self.framerate)
 
     def copy(self):
         """Makes a copy.
 
         Returns: new Wave
         """
-        return copy.deepcopy(self)
+        new = copy.copy(self)
+        new.ys = self.ys.copy()
+        if self._ts is not None:
+            new._ts = self._ts.copy()
+        return new
 
     def __len__(self):
         return len(self.ys)
 
+    @property
+    def nchannels(self):
+        """Number of channels."""
+        return 1 if self.ys.ndim == 1 else self.ys.shape[1]
+
+    def channel(self, i):
+        """Extracts one channel as a mono Wave.
+
+        i: channel index
+
+        returns: Wave
+        """
+        ys = self.ys if self.ys.ndim == 1 else self.ys[:, i]
+        return Wave(ys.copy(), framerate=self.framerate, **self._times())
+
+    def _check_mono(self, name):
+        """Raises ValueError if this wave has more than one channel.
+
+        name: name of the calling method, for the message
+        """
+        if self.nchannels > 1:
+            raise ValueError(f'Wave.{name}: {self.nchannels}-channel wave; '
+                             'use wave.channel(i) to pick one')
+
     @property
     def start(self):
-        return self.ts[0]
+        if self._ts is None:
+            return self._start
+        return self._ts[0]
 
     @property
     def end(self):
-        return self.ts[-1]
+        if self._ts is None:
+            return self._start + (len(self.ys) - 1) / self.framerate
+        return self._ts[-1]
 
     @property
     def duration(self):
@@ -681,13 +772,12 @@ class Wave:
         end = max(self.end, other.end)
         n = int(round((end - start) * self.framerate)) + 1
         ys = np.zeros(n)
-        ts = start + np.arange(n) / self.framerate
 
         def add_ys(wave):
-            i = find_index(wave.start, ts)
+            i = int(round((wave.start - start) * self.framerate))
 
             # make sure the arrays line up reasonably well
-            diff = ts[i] - wave.start
+            diff = start + i / self.framerate - wave.start
             dt = 1 / wave.framerate
             if (diff / dt) > 0.1:
                 warnings.warn("Can't add these waveforms; their "
@@ -699,7 +789,7 @@ class Wave:
         add_ys(self)
         add_ys(other)
 
-        return Wave(ys, ts, self.framerate)
+        return Wave(ys, framerate=self.framerate, start=start)
 
     __radd__ = __add__
         
@@ -732,7 +822,7 @@ class Wave:
         assert len(self) == len(other)
 
         ys = self.ys * other.ys
-        return Wave(ys, self.ts, self.framerate)
+        return Wave(ys, framerate=self.framerate, **self._times())
         
     def max_diff(self, other):
         """Computes the maximum absolute difference between waves.
@@ -773,8 +863,7 @@ class Wave:
         returns: new Wave
         """
         ys = np.diff(self.ys)
-        ts = self.ts[1:].copy()
-        return Wave(ys, ts, self.framerate)
+        return Wave(ys, framerate=self.framerate, **self._times(1))
 
     def cumsum(self):
         """Computes the cumulative sum of the elements.
@@ -782,8 +871,7 @@ class Wave:
         returns: new Wave
         """
         ys = np.cumsum(self.ys)
-        ts = self.ts.copy()
-        return Wave(ys, ts, self.framerate)
+        return Wave(ys, framerate=self.framerate, **self._times())
 
     def quantize(self, bound, dtype):
         """Maps the waveform to quanta.
@@ -831,7 +919,10 @@ class Wave:
         shift: float time shift
         """
         # TODO: track down other uses of this function and check them
-        self.ts += shift
+        if self._ts is None:
+            self._start += shift
+        else:
+            self._ts = self._ts + shift
 
     def roll(self, roll):
         """Rolls this wave by the given number of locations.
@@ -844,15 +935,17 @@ class Wave:
         n: integer index
         """
         self.ys = truncate(self.ys, n)
-        self.ts = truncate(self.ts, n)
+        if self._ts is not None:
+            self._ts = truncate(self._ts, n)
 
     def zero_pad(self, n):
         """Trims this wave to the given length.
 
         n: integer index
         """
+        self._start = self.start
+        self._ts = None
         self.ys = zero_pad(self.ys, n)
-        self.ts = self.start + np.arange(n) / self.framerate
 
     def normalize(self, amp=1.0):
         """Normalizes the signal to the given amplitude.
@@ -883,7 +976,7 @@ class Wave:
         returns: Wave
         """
         if start is None:
-            start = self.ts[0]
+            start = self.start
             i = 0
         else:
             i = self.find_index(start)
@@ -897,15 +990,29 @@ class Wave:
         i: first slice index
         j: second slice index
         """
-        ys = self.ys[i:j].copy()
-        ts = self.ts[i:j].copy()
-        return Wave(ys, ts, self.framerate)
+        return self.view(i, j).copy()
+
+    def view(self, i=None, j=None):
+        """Makes a slice that shares ys with this Wave.
+
+        Nothing is copied, so in-place operations on the view, like
+        window, hamming and scale, modify this wave too; use slice for
+        an independent copy.
+
+        i: first slice index
+        j: second slice index
+
+        returns: Wave
+        """
+        return Wave(self.ys[i:j], framerate=self.framerate,
+                    **self._times(i, j, copy_ts=False))
 
     def make_spectrum(self, full=False):
         """Computes the spectrum using FFT.
 
         returns: Spectrum
         """
+        self._check_mono('make_spectrum')
         n = len(self.ys)
         d = 1 / self.framerate
 
@@ -921,6 +1028,7 @@ class Wave:
     def make_dct(self):
         """Computes the DCT of this wave.
         """
+        self._check_mono('make_dct')
         N = len(self.ys)
         hs = scipy.fftpack.dct(self.ys, type=2)
         fs = (0.5 + np.arange(N)) / 2
@@ -929,32 +1037,36 @@ class Wave:
     def make_spectrogram(self, seg_length, win_flag=True):
         """Computes the spectrogram of the wave.
 
+        Segments overlap by half and are transformed together in one
+        batched FFT.
+
         seg_length: number of samples in each segment
         win_flag: boolean, whether to apply hamming window to each segment
 
         returns: Spectrogram
         """
-        if win_flag:
-            window = np.hamming(seg_length)
-        i, j = 0, seg_length
+        self._check_mono('make_spectrogram')
+        window = np.hamming(seg_length) if win_flag else None
         step = seg_length // 2
 
-        # map from time to Spectrum
-        spec_map = {}
-
-        while j < len(self.ys):
-            segment = self.slice(i, j)
-            if win_flag:
-                segment.window(window)
-
-            # the nominal time for this segment is the midpoint
-            t = (segment.start + segment.end) / 2
-            spec_map[t] = segment.make_spectrum()
-
-            i += step
-            j += step
+        # strided view of the segments; like always, the last one ends
+        # before the last sample
+        frames = asp.frame_signal(self.ys[:-1], seg_length, step)
+        if win_flag:
+            frames = frames * window
+        # FFT along contiguous rows, then store as (freq x time)
+        hs = np.ascontiguousarray(np.fft.rfft(frames, axis=-1).T)
+        fs = np.fft.rfftfreq(seg_length, 1 / self.framerate)
+
+        # the nominal time for each segment is the midpoint
+        firsts = np.arange(len(frames)) * step
+        if self._ts is None:
+            ts = self._start + (firsts + (seg_length - 1) / 2) / self.framerate
+        else:
+            ts = (self._ts[firsts] + self._ts[firsts + seg_length - 1]) / 2
 
-        return Spectrogram(spec_map, seg_length)
+        return Spectrogram(hs, seg_length, ts, fs, self.framerate,
+                           hop_length=step, window=window)
 
     def get_xfactor(self, options):
         try:
@@ -1039,7 +1151,7 @@ class Wave:
         filename: string
         """
         print('Writing', filename)
-        wfile = WavFileWriter(filename, self.framerate)
+        wfile = WavFileWriter(filename, self.framerate, nchannels=self.nchannels)
         wfile.write(self)
         wfile.close()
 
@@ -1076,7 +1188,7 @@ def normalize(ys, amp=1.0):
 
     returns: wave array
     """
-    high, low = abs(max(ys)), abs(min(ys))
+    high, low = abs(np.max(ys)), abs(np.min(ys))
     return amp * ys / max(high, low)
 
 
@@ -1213,7 +1325,7 @@ class Signal:
         n = round(duration * framerate)
         ts = start + np.arange(n) / framerate
         ys = self.evaluate(ts)
-        return Wave(ys, ts, framerate=framerate)
+        return Wave(ys, framerate=framerate, start=start)
 
 
 def infer_framerate(ts):
@@ -7,6 +7,8 @@ License: GNU GPLv3 http://www.gnu.org/licenses/gpl.html
 
 from __future__ import print_function, division
 
+import os
+import tempfile
 import unittest
 import thinkdsp
 
@@ -45,6 +47,90 @@ class Test(unittest.TestCase):
 
         self.assertAlmostEqual(len(impulses), 14333)
 
+    def testLazyTs(self):
+        signal = thinkdsp.CosSignal(freq=440)
+        wave = signal.make_wave(duration=1, start=0.5, framerate=8000)
+        self.assertIsNone(wave._ts)
+        self.assertTrue(np.allclose(wave.ts, 0.5 + np.arange(8000) / 8000))
+
+        part = wave.slice(-1000, None)
+        self.assertAlmostEqual(part.start, 1.375)
+        self.assertAlmostEqual(part.end, wave.end)
+        part.shift(1)
+        self.assertAlmostEqual(part.ts[0], 2.375)
+
+        ts = np.array([0, 0.1, 0.3, 0.7])
+        uneven = thinkdsp.Wave(np.ones(4), ts)
+        self.assertTrue(np.array_equal(uneven.diff().ts, ts[1:]))
+        self.assertAlmostEqual(uneven.slice(1, 3).end, 0.3)
+
+    def testView(self):
+        wave = thinkdsp.Wave(np.arange(10.0), framerate=10)
+        view = wave.view(2, 5)
+        self.assertTrue(np.shares_memory(view.ys, wave.ys))
+        self.assertAlmostEqual(view.start, 0.2)
+
+        part = wave.slice(2, 5)
+        part.scale(2)
+        self.assertEqual(wave.ys[2], 2)
+        view.scale(2)
+        self.assertEqual(wave.ys[2], 4)
+
+        copied = wave.copy()
+        self.assertFalse(np.shares_memory(copied.ys, wave.ys))
+        self.assertTrue(np.array_equal(copied.ts, wave.ts))
+
+    def testSpectrogram(self):
+        signal = thinkdsp.CosSignal(freq=440)
+        wave = signal.make_wave(duration=1, framerate=8000)
+        spectrogram = wave.make_spectrogram(512)
+
+        self.assertEqual(spectrogram.hs.shape, (257, 30))
+        self.assertTrue(spectrogram.hs.flags.c_contiguous)
+        self.assertAlmostEqual(spectrogram.ts[0], 511 / 2 / 8000)
+
+        segment = wave.slice(256, 768)
+        segment.hamming()
+        spectrum = spectrogram.spec_map[spectrogram.ts[1]]
+        self.assertTrue(np.allclose(spectrum.hs, segment.make_spectrum().hs))
+        self.assertAlmostEqual(spectrum.fs[np.argmax(spectrum.amps)], 437.5)
+
+    def testSpectrogramMakeWave(self):
+        signal = thinkdsp.Chirp(start=220, end=440)
+        wave = signal.make_wave(duration=1, start=0.5, framerate=11025)
+        spectrogram = wave.make_spectrogram(511)
+
+        inverse = spectrogram.make_wave()
+        self.assertAlmostEqual(inverse.start, 0.5)
+        self.assertTrue(np.allclose(inverse.ys, wave.ys[:len(inverse)]))
+
+        blocks = list(spectrogram.iter_waves(frames_per_block=5))
+        self.assertTrue(np.allclose(
+            np.concatenate([block.ys for block in blocks]), inverse.ys))
+        self.assertAlmostEqual(blocks[1].start, 0.5 + len(blocks[0]) / 11025)
+
+    def testMultiChannelSpectrum(self):
+        signal = thinkdsp.CosSignal(freq=440)
+        ys = signal.make_wave(duration=1, framerate=8000).ys
+        wave = thinkdsp.Wave(np.column_stack([ys, ys]), framerate=8000)
+
+        self.assertRaises(ValueError, wave.make_spectrum)
+        self.assertRaises(ValueError, wave.make_spectrogram, 512)
+        spectrum = wave.channel(1).make_spectrum()
+        self.assertEqual(spectrum.hs.shape, (4001,))
+
+    def testReadWaveBlocks(self):
+        signal = thinkdsp.CosSignal(freq=440)
+        wave = signal.make_wave(duration=1, framerate=8000)
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'sound.wav')
+            wave.write(filename)
+            blocks = list(thinkdsp.read_wave_blocks(filename, 3000, overlap=500))
+
+        self.assertEqual([len(block) for block in blocks], [3000, 3000, 3000])
+        self.assertAlmostEqual(blocks[1].start, 2500 / 8000)
+        self.assertTrue(np.allclose(blocks[2].ys[-1000:], wave.ys[-1000:], atol=1e-4))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,430 @@
+"""WAV container I/O: PCM decoding, memory-mapped reading and streaming
+writing of long recordings. It needs only NumPy, so recorders and batch
+tools can use it without the plotting stack of thinkdsp.
+"""
+import os
+import struct
+
+import numpy as np
+
+
+def pcm_view(buffer, sampwidth, nchannels=1, floating=False):
+    """Zero-copy (frames x channels) view of little-endian PCM data.
+
+    24-bit samples have no NumPy dtype, so they are viewed as 
+    (frames x channels x 3) bytes.
+
+    Args:
+        buffer: bytes, memoryview or uint8 array of interleaved frames
+        sampwidth (int): Bytes per sample
+        nchannels (int): Number of interleaved channels
+        floating (bool): Samples are IEEE floats instead of integers
+    """
+    xs = np.frombuffer(buffer, dtype=np.uint8)
+    if floating:
+        if sampwidth not in (4, 8):
+            raise ValueError('float sampwidth %d unknown' % sampwidth)
+        return xs.view(f'<f{sampwidth}').reshape(-1, nchannels)
+
+    if sampwidth not in (1, 2, 3, 4):
+        raise ValueError('sampwidth %d unknown' % sampwidth)
+    if sampwidth == 3:
+        return xs.reshape(-1, nchannels, 3)
+    # 8-bit WAV is unsigned
+    dtype = np.uint8 if sampwidth == 1 else f'<i{sampwidth}'
+    return xs.view(dtype).reshape(-1, nchannels)
+
+
+def pcm_to_float(xs, sampwidth):
+    """Convert (part of) a `pcm_view` to floats in [-1, 1).
+
+    Args:
+        xs (np.array): PCM samples as returned by pcm_view, or a slice of them
+        sampwidth (int): Bytes per sample
+    """
+    if xs.dtype.kind == 'f':
+        return xs.astype(np.float64)
+
+    if sampwidth == 1:
+        ys = xs.astype(np.float64) - 128
+    elif sampwidth == 3:
+        # Assemble the bytes in the top of an int32 and shift back to 
+        # sign-extend
+        ys = (xs.astype(np.int32) << [8, 16, 24]).sum(axis=-1, dtype=np.int32) >> 8
+    else:
+        ys = xs
+
+    return ys / 2.0 ** (8 * sampwidth - 1)
+
+
+def decode_pcm(z_bytes, sampwidth, nchannels=1):
+    """Convert little-endian PCM bytes of a WAV file to floats in [-1, 1).
+
+    Args:
+        z_bytes (bytes): Interleaved PCM frames
+        sampwidth (int): Bytes per sample, 1 to 4
+        nchannels (int): Number of interleaved channels
+
+    Return (frames x channels) array
+    """
+    return pcm_to_float(pcm_view(z_bytes, sampwidth, nchannels), sampwidth)
+
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+_UNKNOWN_SIZE = 0xFFFFFFFF
+
+
+def read_wav_header(fp):
+    """Parse the RIFF header of a WAV file up to its data chunk.
+
+    Unlike the wave module, this accepts IEEE float files and reports
+    where the sample data starts.
+
+    Args:
+        fp: Binary file object at the start of the file
+
+    Return dict with framerate, nchannels, sampwidth, floating, offset of
+    the data in bytes and nframes
+    """
+    riff, _, wave_id = struct.unpack('<4sI4s', fp.read(12))
+    if riff != b'RIFF' or wave_id != b'WAVE':
+        raise ValueError('Not a RIFF WAVE file')
+
+    fmt = None
+    while True:
+        header = fp.read(8)
+        if len(header) < 8:
+            raise ValueError('WAV file has no data chunk')
+        chunk_id, chunk_size = struct.unpack('<4sI', header)
+        if chunk_id == b'data':
+            break
+        if chunk_id == b'fmt ':
+            fmt = fp.read(chunk_size)
+            fp.seek(chunk_size % 2, 1)
+        else:
+            # Chunks are padded to an even size
+            fp.seek(chunk_size + chunk_size % 2, 1)
+
+    if fmt is None:
+        raise ValueError('WAV file has no fmt chunk before its data')
+
+    tag, nchannels, framerate, _, block_align, _ = struct.unpack('<HHIIHH', fmt[:16])
+    if tag == WAVE_FORMAT_EXTENSIBLE:
+        # The sub-format GUID starts with the actual format tag
+        tag, = struct.unpack('<H', fmt[24:26])
+    if tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+        raise ValueError('WAV format %#x unsupported' % tag)
+
+    offset = fp.tell()
+    # Writers that stream often leave the data size unset, so trust the 
+    # file size when it is smaller. Recordings past 4 GiB mark the size as
+    # unknown.
+    available = fp.seek(0, 2) - offset
+    if chunk_size == _UNKNOWN_SIZE:
+        chunk_size = available
+    nframes = min(chunk_size, available) // block_align
+
+    return dict(framerate=framerate, nchannels=nchannels, 
+                sampwidth=block_align // nchannels,
+                floating=tag == WAVE_FORMAT_IEEE_FLOAT,
+                offset=offset, nframes=nframes)
+
+
+class WavMap:
+    def __init__(self, filename):
+        """Memory-mapped WAV file. Opening is instant regardless of the
+        size of the file, because nothing is read until it is accessed.
+
+        `samples` is a zero-copy (frames x channels) view of the PCM data, 
+        and `read` converts only the requested range to floats:
+
+            with WavMap('field_recording.wav') as wav:
+                for start in range(0, len(wav), 44100):
+                    ys = wav.read(start, start + 44100, channel=0)
+
+        Args:
+            filename (str or Path): WAV file, PCM 8/16/24/32-bit or float
+        """
+        self.filename = str(filename)
+        with open(self.filename, 'rb') as fp:
+            header = read_wav_header(fp)
+
+        self.framerate = header['framerate']
+        self.nchannels = header['nchannels']
+        self.sampwidth = header['sampwidth']
+        self.floating = header['floating']
+        self.nframes = header['nframes']
+
+        size = self.nframes * self.nchannels * self.sampwidth
+        if size:
+            self.raw = np.memmap(self.filename, dtype=np.uint8, mode='r',
+                                 offset=header['offset'], shape=(size,))
+        else:
+            # mmap can't map zero bytes
+            self.raw = np.zeros(0, dtype=np.uint8)
+        self.samples = pcm_view(self.raw, self.sampwidth, self.nchannels, self.floating)
+
+    def __len__(self):
+        return self.nframes
+
+    @property
+    def duration(self):
+        return self.nframes / self.framerate
+
+    def read(self, start=0, stop=None, channel=None):
+        """Floats in [-1, 1) of frames start to stop.
+
+        Args:
+            start, stop (int): Frame range, like a slice
+            channel (int): Only this channel. Default is every channel.
+
+        Return (frames x channels) array, or 1-D array for one channel
+        """
+        xs = self.samples[start:stop]
+        if channel is not None:
+            xs = xs[:, channel]
+        return pcm_to_float(xs, self.sampwidth)
+
+    def close(self):
+        # The map is released once no view of it is left
+        self.raw = self.samples = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+# Bytes per sample and whether samples are floats
+SAMPLE_FORMATS = {
+    'int16': (2, False),
+    'int24': (3, False),
+    'int32': (4, False),
+    'float32': (4, True),
+}
+
+
+class WavWriter:
+    def __init__(self, filename, samplerate, nchannels=1, sample_format='int16', 
+                 append=False, header_interval=1.0):
+        """Streaming WAV writer for long recordings.
+
+        Float samples in [-1, 1] are clipped and scaled into reusable 
+        buffers, and arrays that already have the sample format of the file
+        are written through the buffer protocol without any copy:
+
+            with WavWriter('capture.wav', 44100, nchannels=2) as writer:
+                writer.write(ys)
+
+        The sizes in the header are refreshed every header_interval seconds
+        of audio, so a recording cut short by a crash stays readable.
+
+        Args:
+            filename (str or Path): WAV file
+            samplerate (int): Samples per second
+            nchannels (int): Number of channels
+            sample_format (str): 'int16', 'int24', 'int32' or 'float32'
+            append (bool): Continue an existing file with the same format
+                           instead of starting a new one
+            header_interval (float): Seconds of audio between header updates
+        """
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f'sample_format must be one of {sorted(SAMPLE_FORMATS)}')
+
+        self.filename = str(filename)
+        self.samplerate = samplerate
+        self.nchannels = nchannels
+        self.sample_format = sample_format
+        self.sampwidth, self.floating = SAMPLE_FORMATS[sample_format]
+        self.block_align = self.sampwidth * self.nchannels
+        self.header_interval = max(1, int(header_interval * samplerate))
+
+        if append and os.path.exists(self.filename):
+            self.fp = open(self.filename, 'r+b')
+            try:
+                self._open_existing()
+            except ValueError:
+                self.fp.close()
+                raise
+        else:
+            self.fp = open(self.filename, 'w+b')
+            self._write_header()
+
+        self.frames_since_header = 0
+        # Reused conversion buffers, grown as needed
+        self._floats = np.empty(0)
+        self._samples = np.empty(0, dtype=self._dtype())
+
+    def _dtype(self):
+        if self.floating:
+            return np.dtype('<f4')
+        # 24-bit samples are scaled in int32 and packed afterwards
+        return np.dtype('<i2') if self.sampwidth == 2 else np.dtype('<i4')
+
+    def _write_header(self):
+        tag = WAVE_FORMAT_IEEE_FLOAT if self.floating else WAVE_FORMAT_PCM
+        fmt = struct.pack('<HHIIHH', tag, self.nchannels, self.samplerate,
+                          self.samplerate * self.block_align, self.block_align,
+                          8 * self.sampwidth)
+        header = [b'RIFF', struct.pack('<I', 0), b'WAVE',
+                  b'fmt ', struct.pack('<I', len(fmt)), fmt]
+        if self.floating:
+            # Non-PCM formats carry the number of frames in a fact chunk
+            header += [b'fact', struct.pack('<I', 4), struct.pack('<I', 0)]
+        header += [b'data', struct.pack('<I', 0)]
+
+        self.fp.write(b''.join(header))
+        self.offset = self.fp.tell()
+        self.fact_position = self.offset - 12 if self.floating else None
+        self.nframes = 0
+
+    def _open_existing(self):
+        header = read_wav_header(self.fp)
+        existing = (header['framerate'], header['nchannels'], 
+                    header['sampwidth'], header['floating'])
+        if existing != (self.samplerate, self.nchannels, self.sampwidth, self.floating):
+            raise ValueError(f'{self.filename} has a different format')
+
+        self.offset = header['offset']
+        self.nframes = header['nframes']
+        # Keep the frame count up to date if the fact chunk is where this
+        # writer puts it
+        self.fp.seek(self.offset - 20)
+        self.fact_position = self.offset - 12 if self.fp.read(4) == b'fact' else None
+        end = self.offset + self.nframes * self.block_align
+        # Allow a pad byte or a partial frame of an interrupted recording,
+        # but nothing that could be another chunk
+        if self.fp.seek(0, 2) - end > self.block_align:
+            raise ValueError(f'{self.filename} has chunks after its data')
+        self.fp.truncate(end)
+        self.fp.seek(end)
+
+    def write(self, ys):
+        """Append frames.
+
+        Args:
+            ys (np.array): 1-D for mono or (frames x channels). Floats are 
+                           clipped to [-1, 1] for integer formats; integer
+                           arrays must already have the sample format of
+                           the file, with int32 holding int24 samples.
+        """
+        ys = np.asarray(getattr(ys, 'ys', ys))
+        if ys.ndim > 2 or ys.size != len(ys) * self.nchannels:
+            raise ValueError(f'Expected {self.nchannels} channels')
+
+        if ys.dtype.kind in 'iu':
+            if ys.dtype.newbyteorder('<') != self._dtype():
+                raise ValueError(f'Integer samples must be {self._dtype()}')
+            samples = ys
+        else:
+            samples = self._convert(ys)
+
+        if self.sampwidth == 3:
+            samples = self._pack24(samples)
+        self.fp.write(np.ascontiguousarray(samples, dtype=samples.dtype.newbyteorder('<')))
+
+        self.nframes += len(ys)
+        self.frames_since_header += len(ys)
+        if self.frames_since_header >= self.header_interval:
+            self.update_header()
+
+    def _buffer(self, name, size, dtype):
+        buffer = getattr(self, name)
+        if len(buffer) < size:
+            buffer = np.empty(size, dtype=dtype)
+            setattr(self, name, buffer)
+        return buffer[:size]
+
+    def _convert(self, ys):
+        samples = self._buffer('_samples', ys.size, self._dtype()).reshape(ys.shape)
+        if self.floating:
+            np.copyto(samples, ys, casting='same_kind')
+            return samples
+
+        floats = self._buffer('_floats', ys.size, np.float64).reshape(ys.shape)
+        np.clip(ys, -1, 1, out=floats)
+        bound = 2 ** (8 * self.sampwidth - 1) - 1
+        np.multiply(floats, bound, out=samples, casting='unsafe')
+        return samples
+
+    def _pack24(self, samples):
+        # Keep the low three bytes of every little-endian int32
+        return samples.astype('<i4', copy=False).view(np.uint8).reshape(-1, 4)[:, :3]
+
+    def update_header(self):
+        """Write the current sizes into the header and flush to disk."""
+        size = self.nframes * self.block_align
+        position = self.fp.tell()
+
+        self.fp.seek(4)
+        self.fp.write(struct.pack('<I', min(position - 8, _UNKNOWN_SIZE)))
+        if self.fact_position is not None:
+            self.fp.seek(self.fact_position)
+            self.fp.write(struct.pack('<I', min(self.nframes, _UNKNOWN_SIZE)))
+        self.fp.seek(self.offset - 4)
+        self.fp.write(struct.pack('<I', min(size, _UNKNOWN_SIZE)))
+
+        self.fp.seek(position)
+        self.fp.flush()
+        self.frames_since_header = 0
+
+    def close(self):
+        if self.fp.closed:
+            return
+        if self.nframes * self.block_align % 2:
+            # Chunks are padded to an even size
+            self.fp.write(b'\0')
+        self.update_header()
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def read_wav_blocks(filename, block_length, overlap=0, channel=None):
+    """Stream float blocks in [-1, 1) of a WAV file with constant memory.
+
+    The file is memory-mapped and each block is converted on its own, 
+    see WavMap.
+
+    Args:
+        filename (str or Path): WAV file, PCM 8/16/24/32-bit or float
+        block_length (int): Number of frames per block. The last block
+                            may be shorter.
+        overlap (int): Number of frames a block shares with the previous
+                       one
+        channel (int): Only this channel. Default is every channel.
+
+    Yields (frames x channels) arrays, or 1-D arrays for one channel
+    """
+    for _, block in wav_blocks(WavMap(filename), block_length, overlap, channel):
+        yield block
+
+
+def wav_blocks(wav, block_length, overlap=0, channel=None):
+    """Stream (first frame, block) of an open WavMap, which is closed at
+    the end, see read_wav_blocks.
+
+    Args:
+        wav (WavMap): WAV file
+        block_length, overlap, channel: See read_wav_blocks
+    """
+    if not 0 <= overlap < block_length:
+        raise ValueError('overlap must be in [0, block_length)')
+
+    with wav:
+        start = 0
+        while start < len(wav):
+            stop = min(start + block_length, len(wav))
+            yield start, wav.read(start, stop, channel=channel)
+            if stop == len(wav):
+                return
+            start = stop - overlap
@@ -0,0 +1,109 @@
+"""Tests for the WAV container I/O of pitch_perfect.
+"""
+
+import os
+import tempfile
+import unittest
+import wave
+
+import numpy as np
+
+from pitch_perfect.config import PATHS
+from pitch_perfect.thinkdsp import wavio
+
+
+def make_sine(freq, n=11025, samplerate=44100):
+    ts = np.arange(n) / samplerate
+    return np.sin(2 * np.pi * freq * ts)
+
+
+class Test(unittest.TestCase):
+
+    def testWavMap(self):
+        filename = PATHS.data / 'a4.wav'
+        with wave.open(str(filename), 'rb') as fp:
+            expected = wavio.decode_pcm(
+                fp.readframes(fp.getnframes()), fp.getsampwidth(), fp.getnchannels())
+
+        with wavio.WavMap(filename) as wav:
+            self.assertEqual(len(wav), len(expected))
+            self.assertEqual(wav.framerate, 44100)
+            self.assertTrue(np.array_equal(wav.read(), expected))
+            self.assertTrue(np.array_equal(wav.read(100, 200, channel=1), expected[100:200, 1]))
+
+    def testWavMap24Bit(self):
+        xs = np.array([[0, -1], [2 ** 23 - 1, -2 ** 23], [12345, -12345]])
+        z_bytes = (xs.astype('<i4').view(np.uint8).reshape(-1, 4)[:, :3]).tobytes()
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'test.wav')
+            with wave.open(filename, 'wb') as fp:
+                fp.setnchannels(2)
+                fp.setsampwidth(3)
+                fp.setframerate(8000)
+                fp.writeframes(z_bytes)
+
+            with wavio.WavMap(filename) as wav:
+                self.assertTrue(np.array_equal(wav.read(), xs / 2 ** 23))
+        self.assertTrue(np.array_equal(wavio.decode_pcm(z_bytes, 3, 2), xs / 2 ** 23))
+
+    def testReadWavBlocks(self):
+        filename = PATHS.data / 'a4.wav'
+        with wavio.WavMap(filename) as wav:
+            expected = wav.read(channel=1)
+
+        blocks = list(wavio.read_wav_blocks(filename, 1000, overlap=200, channel=1))
+        self.assertTrue(all(len(block) == 1000 for block in blocks[:-1]))
+        self.assertTrue(np.array_equal(blocks[1][:200], blocks[0][-200:]))
+        self.assertTrue(np.array_equal(
+            np.concatenate([blocks[0]] + [block[200:] for block in blocks[1:]]), expected))
+
+        with self.assertRaises(ValueError):
+            next(wavio.read_wav_blocks(filename, 1000, overlap=1000))
+
+    def testWavBlocks(self):
+        filename = PATHS.data / 'a4.wav'
+        wav = wavio.WavMap(filename)
+        blocks = list(wavio.wav_blocks(wav, 1000, overlap=200, channel=0))
+
+        self.assertEqual([start for start, _ in blocks[:3]], [0, 800, 1600])
+        with wavio.WavMap(filename) as expected:
+            self.assertTrue(np.array_equal(blocks[1][1], expected.read(800, 1800, channel=0)))
+        # The map is closed once the blocks run out
+        self.assertIsNone(wav.samples)
+
+    def testWavWriter(self):
+        ys = np.stack([make_sine(220, n=1001), make_sine(440, n=1001)], axis=1)
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'test.wav')
+            for sample_format, atol in (('int16', 1e-4), ('int24', 1e-6), ('float32', 1e-7)):
+                with wavio.WavWriter(filename, 8000, nchannels=2, sample_format=sample_format) as writer:
+                    for chunk in np.array_split(ys, 3):
+                        writer.write(chunk)
+
+                with wavio.WavMap(filename) as wav:
+                    self.assertEqual(len(wav), 1001)
+                    self.assertTrue(np.allclose(wav.read(), ys, atol=atol))
+
+            with wavio.WavWriter(filename, 8000, sample_format='int16') as writer:
+                writer.write(np.array([1, -2, 3], dtype=np.int16))
+            with wave.open(filename, 'rb') as fp:
+                self.assertEqual(fp.getnframes(), 3)
+                self.assertEqual(fp.readframes(3), np.array([1, -2, 3], dtype='<i2').tobytes())
+
+    def testWavWriterAppend(self):
+        ys = make_sine(440, n=999)
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'test.wav')
+            for chunk in np.array_split(ys, 3):
+                with wavio.WavWriter(filename, 8000, sample_format='int24', append=True) as writer:
+                    writer.write(chunk)
+
+            with wavio.WavMap(filename) as wav:
+                self.assertTrue(np.allclose(wav.read(channel=0), ys, atol=1e-6))
+
+            with self.assertRaises(ValueError):
+                wavio.WavWriter(filename, 8000, sample_format='int16', append=True)
+
+
+if __name__ == "__main__":
+    unittest.main()